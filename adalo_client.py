@@ -4,18 +4,52 @@ Adalo API Client
 Wrapper for Adalo REST API to manage users and daily revenue records.
 """
 
+import json
 import os
+import threading
 import time
-from typing import List, Dict, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Any, Tuple, Iterator
 from datetime import datetime, timedelta, timezone
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to stdlib json
+    orjson = None
+
+
+def _json_loads(content: bytes) -> Any:
+    """Decode a JSON response body (orjson when available)."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+class AdaloAPIError(Exception):
+    """Adalo API returned an error status."""
+
+    def __init__(self, status: int, body: str):
+        super().__init__(f"Adalo API error {status}: {body}")
+        self.status = status
+        self.body = body
 
 
 class AdaloClient:
     """Client for interacting with Adalo Collections API."""
 
     BASE_URL = "https://api.adalo.com/v0/apps"
-    RATE_LIMIT_DELAY = 0.2  # 5 req/sec = 0.2s between requests
+    RATE_LIMIT_CAPACITY = 5.0  # Max burst size (requests)
+    RATE_LIMIT_REFILL = 5.0  # Tokens per second (5 req/sec)
+    REQUEST_TIMEOUT = (5, 30)  # (connect, read) seconds
+    GET_CACHE_TTL = 30.0  # Seconds a GET response is reused (0 disables caching)
+    BATCH_FLUSH_EVERY = 25  # Queued revenue records that trigger a flush
+    BATCH_MAX_WORKERS = 5  # Parallel writes per flush (token bucket still caps at 5 req/sec)
+    ERROR_BODY_LIMIT = 2048  # Max bytes of an error body kept in AdaloAPIError
+    OPG_REQUIRED_FIELDS = ("navlogin", "navpassword", "signKey", "taxNumber", "apnumber")
 
     def __init__(self, app_id: str, api_key: str, users_collection_id: str, revenues_collection_id: str):
         """
@@ -35,23 +69,103 @@ class AdaloClient:
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
-        self.last_request_time = 0
+        # Token bucket state for _rate_limit
+        self._tokens = self.RATE_LIMIT_CAPACITY
+        self._last_refill = time.monotonic()
+        self._rate_lock = threading.Lock()  # client may be shared by sync worker threads
+        # Circuit breaker: after a 429 all callers hold until this monotonic time
+        self._open_until = 0.0
+
+        # GET response cache: (url, params) -> (fetched_at, raw body); cleared on any write.
+        # Bodies are re-parsed on each hit so callers never share (and mutate) a cached dict.
+        self._get_cache: Dict[Tuple, Tuple[float, bytes]] = {}
+        self._cache_lock = threading.Lock()
+
+        # Per-thread write buffers used by begin_batch()
+        self._batch = threading.local()
+
+        # Pooled session: reuses TCP connections and TLS sessions across calls
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(
+                total=5,
+                backoff_factor=0.5,
+                # 429 is left to _request, which honours Retry-After and opens the breaker
+                status_forcelist=[502, 503, 504],
+                # POST is not idempotent - a retried 5xx could duplicate revenue records
+                allowed_methods=frozenset(['GET', 'PUT']),
+                raise_on_status=False
+            )
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        """Close the underlying HTTP session."""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def _rate_limit(self):
-        """Enforce rate limiting (5 req/sec)."""
-        elapsed = time.time() - self.last_request_time
-        if elapsed < self.RATE_LIMIT_DELAY:
-            time.sleep(self.RATE_LIMIT_DELAY - elapsed)
-        self.last_request_time = time.time()
+        """
+        Enforce rate limiting (5 req/sec) with a token bucket.
+
+        Bursts of up to RATE_LIMIT_CAPACITY requests pass immediately;
+        only over-quota requests wait for the bucket to refill. While the
+        circuit breaker is open (after a 429) every caller waits it out.
+        """
+        hold = self._open_until - time.monotonic()
+        if hold > 0:
+            time.sleep(hold)
+
+        with self._rate_lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.RATE_LIMIT_CAPACITY,
+                self._tokens + (now - self._last_refill) * self.RATE_LIMIT_REFILL
+            )
+            self._last_refill = now
+
+            if self._tokens < 1:
+                time.sleep((1 - self._tokens) / self.RATE_LIMIT_REFILL)
+                self._tokens = 0.0
+                self._last_refill = time.monotonic()
+            else:
+                self._tokens -= 1
 
     def _get_collection_url(self, collection_id: str) -> str:
         """Get full URL for a collection."""
         return f"{self.BASE_URL}/{self.app_id}/collections/{collection_id}"
 
+    @staticmethod
+    def _retry_after(response, default: float = 1.0) -> float:
+        """Seconds to wait from a Retry-After header (falls back to default)."""
+        try:
+            return max(0.0, float(response.headers.get('Retry-After', default)))
+        except ValueError:
+            # HTTP-date form is not worth parsing here
+            return default
+
+    def clear_cache(self):
+        """Drop all cached GET responses."""
+        with self._cache_lock:
+            self._get_cache.clear()
+
     def _request(self, method: str, url: str, **kwargs) -> Dict[str, Any]:
         """
         Make HTTP request with rate limiting and error handling.
 
+        GET responses are reused for GET_CACHE_TTL seconds, so repeated
+        reads within a sync (e.g. paging the users collection twice) do not
+        spend rate-limit budget. Any successful write clears the cache.
+
         Args:
             method: HTTP method (GET, POST, PUT, etc.)
             url: Request URL
@@ -61,53 +175,197 @@ class AdaloClient:
             Response JSON
 
         Raises:
-            Exception: If request fails
+            AdaloAPIError: If Adalo returns an error status
         """
+        cache_key = None
+        if method == "GET" and self.GET_CACHE_TTL > 0:
+            cache_key = (url, tuple(sorted((kwargs.get("params") or {}).items())))
+            with self._cache_lock:
+                cached = self._get_cache.get(cache_key)
+            if cached and time.monotonic() - cached[0] < self.GET_CACHE_TTL:
+                return _json_loads(cached[1])
+
         self._rate_limit()
 
-        response = requests.request(method, url, headers=self.headers, **kwargs)
+        kwargs.setdefault("timeout", self.REQUEST_TIMEOUT)
+        if orjson is not None and "json" in kwargs:
+            # Session headers already carry Content-Type: application/json
+            kwargs["data"] = orjson.dumps(kwargs.pop("json"))
+        # Streamed, so an error body is only read up to ERROR_BODY_LIMIT bytes
+        kwargs["stream"] = True
+        response = self.session.request(method, url, **kwargs)
 
         if response.status_code == 429:
-            # Rate limited, wait and retry once
-            time.sleep(1)
+            # Rate limited: open the breaker so every thread backs off, then retry once
+            self._open_until = max(self._open_until, time.monotonic() + self._retry_after(response))
+            response.close()
             self._rate_limit()
-            response = requests.request(method, url, headers=self.headers, **kwargs)
+            response = self.session.request(method, url, **kwargs)
 
         if response.status_code >= 400:
-            raise Exception(f"Adalo API error {response.status_code}: {response.text}")
+            # Bounded read: gateway errors can return large HTML pages
+            with response:
+                body = response.raw.read(self.ERROR_BODY_LIMIT, decode_content=True)
+            raise AdaloAPIError(response.status_code, body.decode('utf-8', 'replace'))
+
+        data = _json_loads(response.content)
 
-        return response.json()
+        if cache_key is not None:
+            with self._cache_lock:
+                self._get_cache[cache_key] = (time.monotonic(), response.content)
+        elif method != "GET":
+            self.clear_cache()
 
-    def get_all_users(self, limit: int = 100) -> List[Dict[str, Any]]:
+        return data
+
+    def _batching(self) -> bool:
+        return getattr(self._batch, 'active', False)
+
+    @contextmanager
+    def begin_batch(self):
         """
-        Get all users with pagination.
+        Buffer create_daily_revenue/update_user_sync writes and send them together.
+
+        Revenue records are posted in parallel when BATCH_FLUSH_EVERY are queued
+        and on exit; user updates are merged per user and sent last, so the sync
+        marker is only written after all revenue records succeeded. If the block
+        raises, unsent writes are discarded. Buffers are per thread.
+
+        Usage:
+            with client.begin_batch():
+                client.create_daily_revenue(...)
+        """
+        if self._batching():
+            # Nested batch: the outermost block flushes
+            yield self
+            return
+
+        self._batch.active = True
+        self._batch.revenues = []
+        self._batch.user_updates = {}
+        try:
+            yield self
+            self.flush_batch()
+        finally:
+            self._batch.active = False
+            self._batch.revenues = []
+            self._batch.user_updates = {}
+
+    def flush_batch(self):
+        """Send all writes queued by begin_batch()."""
+        if not self._batching():
+            return
+        self._flush_revenues()
+
+        user_updates, self._batch.user_updates = self._batch.user_updates, {}
+        for user_id, payload in user_updates.items():
+            url = f"{self._get_collection_url(self.users_collection_id)}/{user_id}"
+            self._request("PUT", url, json=payload)
+
+    def _flush_revenues(self):
+        """Post queued revenue records in parallel."""
+        revenues, self._batch.revenues = self._batch.revenues, []
+        if not revenues:
+            return
+
+        url = self._get_collection_url(self.revenues_collection_id)
+        with ThreadPoolExecutor(max_workers=self.BATCH_MAX_WORKERS) as executor:
+            # list() re-raises the first failed write
+            list(executor.map(lambda payload: self._request("POST", url, json=payload), revenues))
+
+    @staticmethod
+    def _is_last_page(data: Dict[str, Any], offset: int) -> bool:
+        """
+        Check a list response's total count, if Adalo reports one.
+
+        Saves the extra empty-page request when the collection size is an
+        exact multiple of the page size.
+        """
+        total = data.get("totalCount")
+        return isinstance(total, int) and offset >= total
+
+    def _iter_records(self, url: str, limit: int = 100,
+                      extra_params: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield records of a collection page by page.
 
         Args:
+            url: Collection URL
             limit: Records per page (max 100)
+            extra_params: Additional query parameters (e.g., filterKey/filterValue)
 
-        Returns:
-            List of user records
+        Yields:
+            Collection records
         """
-        url = self._get_collection_url(self.users_collection_id)
         offset = 0
-        all_users = []
 
         while True:
-            params = {"offset": offset, "limit": limit}
+            params = {"offset": offset, "limit": limit, **(extra_params or {})}
             data = self._request("GET", url, params=params)
 
             records = data.get("records", [])
             if not records:
                 break
 
-            all_users.extend(records)
+            yield from records
             offset += len(records)
 
-            # If we got fewer records than limit, we're done
-            if len(records) < limit:
+            # If we got fewer records than limit, or reached the reported total, we're done
+            if len(records) < limit or self._is_last_page(data, offset):
                 break
 
-        return all_users
+    def iter_users(self, limit: int = 100, filter_key: Optional[str] = None,
+                   filter_value: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over users with pagination, one page in memory at a time.
+
+        Args:
+            limit: Records per page (max 100)
+            filter_key: Optional field name to filter on server-side (Adalo filterKey)
+            filter_value: Value for filter_key (Adalo filterValue)
+
+        Yields:
+            User records
+        """
+        extra_params = {"filterKey": filter_key, "filterValue": filter_value} if filter_key else None
+        yield from self._iter_records(self._get_collection_url(self.users_collection_id), limit, extra_params)
+
+    def get_all_users(self, limit: int = 100, filter_key: Optional[str] = None,
+                      filter_value: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get all users with pagination.
+
+        Args:
+            limit: Records per page (max 100)
+            filter_key: Optional field name to filter on server-side (Adalo filterKey)
+            filter_value: Value for filter_key (Adalo filterValue)
+
+        Returns:
+            List of user records
+        """
+        return list(self.iter_users(limit, filter_key, filter_value))
+
+    def iter_opg_users(self) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over users with OPG enabled, filtered server-side.
+
+        Only users with 'onlinepenztargep' set are paged in, instead of the
+        whole collection. Callers should still check the flag, in case the
+        filter is ignored.
+
+        Yields:
+            User records
+        """
+        yield from self.iter_users(filter_key="onlinepenztargep", filter_value="true")
+
+    def get_opg_users(self) -> List[Dict[str, Any]]:
+        """
+        Get users with OPG enabled, filtered server-side (see iter_opg_users).
+
+        Returns:
+            List of user records
+        """
+        return list(self.iter_opg_users())
 
     def get_users_to_sync(self, days_threshold: int = 10) -> List[Dict[str, Any]]:
         """
@@ -119,23 +377,19 @@ class AdaloClient:
         Returns:
             List of users that need syncing
         """
-        all_users = self.get_all_users()
-        threshold_date = datetime.now(timezone.utc) - timedelta(days=days_threshold)
+        now = datetime.now(timezone.utc)
+        threshold_date = now - timedelta(days=days_threshold)
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
         users_to_sync = []
 
-        for user in all_users:
+        # Stream users so non-qualifying records are dropped page by page
+        for user in self.iter_opg_users():
             # Check if OPG is enabled for this user
             if not user.get("onlinepenztargep"):
                 continue
 
-            # Check if user has NAV credentials
-            if not all([
-                user.get("navlogin"),
-                user.get("navpassword"),
-                user.get("signKey"),
-                user.get("taxNumber"),
-                user.get("apnumber")
-            ]):
+            # Check if user has NAV credentials (generator short-circuits on first miss)
+            if not all(user.get(field) for field in self.OPG_REQUIRED_FIELDS):
                 continue
 
             # Check last sync date
@@ -149,7 +403,6 @@ class AdaloClient:
                     last_sync_dt = datetime.fromisoformat(last_sync.replace('Z', '+00:00'))
 
                     # Skip if already synced today
-                    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
                     if last_sync_dt >= today:
                         # Already synced today, skip
                         continue
@@ -176,7 +429,7 @@ class AdaloClient:
             total_revenue: Total revenue in HUF (forint)
 
         Returns:
-            Created record
+            Created record (the queued payload inside begin_batch())
         """
         url = self._get_collection_url(self.revenues_collection_id)
 
@@ -189,6 +442,12 @@ class AdaloClient:
             "fajldatuma": date  # ISO date format: YYYY-MM-DD
         }
 
+        if self._batching():
+            self._batch.revenues.append(payload)
+            if len(self._batch.revenues) >= self.BATCH_FLUSH_EVERY:
+                self._flush_revenues()
+            return payload
+
         return self._request("POST", url, json=payload)
 
     def update_user_sync(self, user_id: int, last_sync_at: str, last_file_number: int) -> Dict[str, Any]:
@@ -201,7 +460,7 @@ class AdaloClient:
             last_file_number: Last synced file number
 
         Returns:
-            Updated user record
+            Updated user record (the queued payload inside begin_batch())
         """
         url = f"{self._get_collection_url(self.users_collection_id)}/{user_id}"
 
@@ -210,6 +469,10 @@ class AdaloClient:
             "lastbizonylatletoltve": str(last_file_number)
         }
 
+        if self._batching():
+            self._batch.user_updates.setdefault(user_id, {}).update(payload)
+            return payload
+
         return self._request("PUT", url, json=payload)
 
     def get_user_by_id(self, user_id: int) -> Dict[str, Any]:
@@ -251,34 +514,18 @@ class AdaloClient:
             List of revenue records
         """
         url = self._get_collection_url(self.revenues_collection_id)
-        offset = 0
-        limit = 100
         all_revenues = []
 
-        while True:
-            params = {"offset": offset, "limit": limit}
-            data = self._request("GET", url, params=params)
-
-            records = data.get("records", [])
-            if not records:
-                break
-
+        for record in self._iter_records(url):
             # Filter by user_id
-            for record in records:
-                if record.get('user_opginvoice') == user_id:
-                    # Optional: filter by year
-                    if year:
-                        revenue_date = record.get('fajldatuma')
-                        if revenue_date and revenue_date.startswith(str(year)):
-                            all_revenues.append(record)
-                    else:
+            if record.get('user_opginvoice') == user_id:
+                # Optional: filter by year
+                if year:
+                    revenue_date = record.get('fajldatuma')
+                    if revenue_date and revenue_date.startswith(str(year)):
                         all_revenues.append(record)
-
-            offset += len(records)
-
-            # If we got fewer records than limit, we're done
-            if len(records) < limit:
-                break
+                else:
+                    all_revenues.append(record)
 
         return all_revenues
 
@@ -287,6 +534,9 @@ def create_client_from_env() -> AdaloClient:
     """
     Create AdaloClient instance from environment variables.
 
+    The returned client can be used as a context manager to close its
+    HTTP session when done.
+
     Required env vars:
         - ADALO_APP_ID
         - ADALO_API_KEY
@@ -2,14 +2,42 @@
 Cron job script for daily automatic OPG sync.
 
 This script is called by Render.com cron job daily at 02:00 UTC.
-It calls the web service /api/sync/all endpoint.
+It starts a background sync via the web service /api/sync/all endpoint and
+polls /api/sync/tasks/<task_id> until it finishes, so a long sync is not
+cut off by an HTTP timeout.
 """
 
 import os
 import sys
+import time
 import requests
 from datetime import datetime
 
+# Seconds between task status polls, and the overall wait limit
+POLL_INTERVAL = int(os.environ.get("CRON_POLL_INTERVAL", "15"))
+MAX_WAIT = int(os.environ.get("CRON_MAX_WAIT", "7200"))
+
+
+def wait_for_task(session: requests.Session, status_url: str) -> requests.Response:
+    """
+    Poll a background sync task until it is no longer running (or MAX_WAIT passes).
+
+    The returned task status is done, failed or lost (see /api/sync/tasks/<task_id>).
+    """
+    deadline = time.monotonic() + MAX_WAIT
+    while True:
+        time.sleep(POLL_INTERVAL)
+        try:
+            response = session.get(status_url, timeout=30)
+        except requests.RequestException as e:
+            # A transient error while polling does not mean the sync failed
+            print(f"  Poll failed ({str(e)}), retrying...")
+            response = None
+        if response is not None and (response.status_code != 200 or response.json().get('status') != 'running'):
+            return response
+        if time.monotonic() > deadline:
+            raise requests.Timeout(f"Sync still running after {MAX_WAIT} seconds")
+
 
 def main():
     """Run daily sync via web service API."""
@@ -30,9 +58,24 @@ def main():
     print(f"Calling: {endpoint}")
 
     try:
-        response = requests.post(endpoint, headers=headers, json={}, timeout=300)
+        with requests.Session() as session:
+            session.headers.update(headers)
+            response = session.post(endpoint, json={"background": True}, timeout=300)
 
-        if response.status_code == 200:
+            if response.status_code == 202:
+                task = response.json()
+                if task.get('already_running'):
+                    print(f"  A sync is already running, waiting for it: {task['task_id']}")
+                else:
+                    print(f"  Background sync started: {task['task_id']}")
+                response = wait_for_task(session, f"{web_service_url}{task['status_url']}")
+
+        status = response.json().get('status', 'done') if response.status_code == 200 else None
+        if status == 'lost':
+            print("✗ Sync task was lost (the worker running it died or it timed out on the server)")
+            print(f"  Response: {response.text}")
+            sys.exit(1)
+        if status == 'done':
             data = response.json()
             print(f"✓ Sync successful!")
             print(f"  Total users: {data.get('total_users', 0)}")
@@ -40,7 +83,7 @@ def main():
             print(f"  Failed: {data.get('failed', 0)}")
             sys.exit(0)
         else:
-            print(f"✗ Sync failed with status {response.status_code}")
+            print(f"✗ Sync failed with status {response.status_code}" + (f" (task {status})" if status else ""))
             print(f"  Response: {response.text}")
             sys.exit(1)
 
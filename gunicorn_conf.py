@@ -0,0 +1,26 @@
+"""
+Gunicorn configuration for the OPG Sync web service.
+
+Usage:
+    gunicorn -c gunicorn_conf.py web_api:app
+
+Threaded workers keep /health and manual syncs responsive while a long
+/api/sync/all runs on another thread.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Worker processes and request threads per worker
+workers = int(os.environ.get('WEB_WORKERS', '2'))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', '4'))
+
+# With gthread this is a worker heartbeat timeout, not a per-request limit: the worker's
+# main loop keeps notifying the arbiter while long syncs run on request threads. The
+# margin only covers a main loop starved by CPU-bound work (GIL) before the restart.
+timeout = int(os.environ.get('WEB_TIMEOUT', '120'))
+
+# Import the app once in the master so workers share the loaded modules
+preload_app = True
@@ -10,22 +10,38 @@ Based on the NAV API v3 specification.
 import hashlib
 import hmac
 import base64
+import functools
+import re
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Iterator, Mapping
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import unpad
 import uuid
 
 
+# Request namespaces (API elements are unprefixed, common elements use common:)
+NS_API = 'http://schemas.nav.gov.hu/OSA/3.0/api'
+NS_COMMON = 'http://schemas.nav.gov.hu/NTCA/1.0/common'
+
+# Precompiled patterns
+_TAX_DIGITS_RE = re.compile(r'(\d{8})')
+_NON_DIGIT_RE = re.compile(r'\D+')
+
+
 class NavOnlineInvoiceConfig:
     """Configuration for NAV Online Invoice API"""
 
     TEST_URL = "https://api-test.onlineszamla.nav.gov.hu/invoiceService/v3"
     PROD_URL = "https://api.onlineszamla.nav.gov.hu/invoiceService/v3"
 
-    def __init__(self, base_url: str, user_data: Dict[str, str], software_data: Dict[str, str]):
+    def __init__(self, base_url: str, user_data: Dict[str, str], software_data: Mapping[str, str]):
         """
         Initialize configuration
 
@@ -53,15 +69,124 @@ class NavOnlineInvoiceConfig:
         self.verify_ssl = True
         self.timeout = 60
 
+        # Password hash: SHA-512(password), computed once per config
+        self.password_hash_sha512 = hashlib.sha512(user_data['password'].encode('utf-8')).hexdigest().upper()
+        self.sign_key_bytes = user_data['signKey'].encode('utf-8')
+
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+def get_shared_session() -> requests.Session:
+    """
+    Process-wide HTTP session for NAV API calls
+
+    Created on first use and shared by all connectors, so keep-alive TLS
+    connections are reused across reporters, users and worker threads.
+    """
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            session = requests.Session()
+            session.headers.update({
+                'Content-Type': 'application/xml',
+                'Accept': 'application/xml'
+            })
+            adapter = HTTPAdapter(
+                pool_connections=8,
+                pool_maxsize=32,
+                max_retries=Retry(
+                    total=3,
+                    backoff_factor=0.5,
+                    status_forcelist=[500, 502, 503, 504],
+                    raise_on_status=False
+                )
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _shared_session = session
+        return _shared_session
+
 
 class NavOnlineInvoiceConnector:
     """Handles HTTP communication with NAV API"""
 
-    def __init__(self, config: NavOnlineInvoiceConfig):
+    RATE_LIMIT_CAPACITY = 5.0  # Max burst size (requests)
+    RATE_LIMIT_REFILL = 5.0  # Tokens per second, shared by all connectors in the process
+
+    # Token bucket state is class-level so concurrent reporters share one budget
+    _tokens = RATE_LIMIT_CAPACITY
+    _last_refill = time.monotonic()
+    _rate_lock = threading.Lock()
+
+    def __init__(self, config: NavOnlineInvoiceConfig, session: Optional[requests.Session] = None):
         self.config = config
         self.last_request_id = None
         self.last_response_xml = None
 
+        # Pooled keep-alive connections, shared process-wide unless given
+        self.session = session if session is not None else get_shared_session()
+
+    @classmethod
+    def _rate_limit(cls):
+        """
+        Enforce the process-wide NAV request rate with a token bucket
+
+        Bursts of up to RATE_LIMIT_CAPACITY requests pass immediately;
+        only over-quota requests wait for the bucket to refill, so the
+        concurrent month/page/user fan-out cannot trigger NAV throttling.
+        """
+        with cls._rate_lock:
+            now = time.monotonic()
+            cls._tokens = min(
+                cls.RATE_LIMIT_CAPACITY,
+                cls._tokens + (now - cls._last_refill) * cls.RATE_LIMIT_REFILL
+            )
+            cls._last_refill = now
+
+            if cls._tokens < 1:
+                time.sleep((1 - cls._tokens) / cls.RATE_LIMIT_REFILL)
+                cls._tokens = 0.0
+                cls._last_refill = time.monotonic()
+            else:
+                cls._tokens -= 1
+
+    def _send(self, endpoint: str, request_xml_str: str, request_id: str,
+              stream: bool = False) -> requests.Response:
+        """Send POST request to NAV API and check the HTTP status"""
+        url = self.config.base_url + endpoint
+        self.last_request_id = request_id
+
+        self._rate_limit()
+        response = self.session.post(
+            url,
+            data=request_xml_str.encode('utf-8'),
+            verify=self.config.verify_ssl,
+            timeout=self.config.timeout,
+            stream=stream
+        )
+
+        if response.status_code != 200:
+            try:
+                raise Exception(f"HTTP {response.status_code}: {response.text}")
+            finally:
+                response.close()
+
+        return response
+
+    @staticmethod
+    def _check_result(result_elem: ET.Element):
+        """Raise if a NAV <result> element reports an error"""
+        func_code = result_elem.find('.//{*}funcCode')
+        if func_code is not None and func_code.text != 'OK':
+            error_code = result_elem.find('.//{*}errorCode')
+            message = result_elem.find('.//{*}message')
+            error_msg = f"NAV API Error: {error_code.text if error_code is not None else 'Unknown'}"
+            if message is not None:
+                error_msg += f" - {message.text}"
+            raise Exception(error_msg)
+
     def post(self, endpoint: str, request_xml_str: str, request_id: str) -> ET.Element:
         """
         Send POST request to NAV API
@@ -77,24 +202,7 @@ class NavOnlineInvoiceConnector:
         Raises:
             Exception: If request fails or NAV returns error
         """
-        url = self.config.base_url + endpoint
-        self.last_request_id = request_id
-
-        headers = {
-            'Content-Type': 'application/xml',
-            'Accept': 'application/xml'
-        }
-
-        response = requests.post(
-            url,
-            data=request_xml_str.encode('utf-8'),
-            headers=headers,
-            verify=self.config.verify_ssl,
-            timeout=self.config.timeout
-        )
-
-        if response.status_code != 200:
-            raise Exception(f"HTTP {response.status_code}: {response.text}")
+        response = self._send(endpoint, request_xml_str, request_id)
 
         # Parse response XML
         root = ET.fromstring(response.content)
@@ -103,24 +211,53 @@ class NavOnlineInvoiceConnector:
         # Check for NAV API errors
         result_elem = root.find('.//{*}result')
         if result_elem is not None:
-            func_code = result_elem.find('.//{*}funcCode')
-            if func_code is not None and func_code.text != 'OK':
-                error_code = result_elem.find('.//{*}errorCode')
-                message = result_elem.find('.//{*}message')
-                error_msg = f"NAV API Error: {error_code.text if error_code is not None else 'Unknown'}"
-                if message is not None:
-                    error_msg += f" - {message.text}"
-                raise Exception(error_msg)
+            self._check_result(result_elem)
 
         return root
 
+    def post_stream(self, endpoint: str, request_xml_str: str, request_id: str) -> Iterator[ET.Element]:
+        """
+        Send POST request to NAV API and parse the response incrementally
+
+        Elements are yielded as their end tags are parsed, straight from the
+        socket, so the caller can process and clear() large repeated elements
+        without the whole response tree being held in memory.
+
+        Args:
+            endpoint: API endpoint path (e.g., /queryInvoiceDigest)
+            request_xml_str: XML request body as string
+            request_id: Unique request ID
+
+        Yields:
+            Response XML elements in document (end tag) order
+
+        Raises:
+            Exception: If request fails or NAV returns error
+        """
+        response = self._send(endpoint, request_xml_str, request_id, stream=True)
+        self.last_response_xml = None
+
+        try:
+            response.raw.decode_content = True  # Let urllib3 undo gzip/br
+            result_checked = False
+            for _, elem in ET.iterparse(response.raw, events=('end',)):
+                if not result_checked and elem.tag.rpartition('}')[2] == 'result':
+                    # Check for NAV API errors
+                    self._check_result(elem)
+                    result_checked = True
+                yield elem
+        finally:
+            response.close()
+
 
 class NavOnlineInvoiceReporter:
     """Main class for interacting with NAV Online Invoice API"""
 
-    def __init__(self, config: NavOnlineInvoiceConfig):
+    def __init__(self, config: NavOnlineInvoiceConfig, session: Optional[requests.Session] = None):
         self.config = config
-        self.connector = NavOnlineInvoiceConnector(config)
+        self.connector = NavOnlineInvoiceConnector(config, session)
+        # Software block never changes for a config, serialize it once
+        self._software_xml_str = self._build_software_element()
 
     def _generate_request_id(self) -> str:
         """Generate unique request ID (RID followed by timestamp)"""
@@ -132,9 +269,9 @@ class NavOnlineInvoiceReporter:
         Get current timestamp in NAV format with milliseconds
         Format: YYYY-MM-DDTHH:MM:SS.sssZ (UTC)
         """
-        now = datetime.utcnow()
-        millis = now.microsecond // 1000
-        return f"{now.strftime('%Y-%m-%dT%H:%M:%S')}.{millis:03d}Z"
+        now = time.time()
+        millis = int(now % 1 * 1000)
+        return time.strftime('%Y-%m-%dT%H:%M:%S.', time.gmtime(now)) + f'{millis:03d}Z'
 
     def _create_request_signature(self, request_id: str, timestamp: str) -> str:
         """
@@ -147,61 +284,49 @@ class NavOnlineInvoiceReporter:
         Returns:
             Hex encoded signature (uppercase)
         """
-        # Remove milliseconds and non-digits from timestamp for signature
+        # Remove milliseconds and separators from timestamp for signature
         # Format: yyyyMMddHHmmss (14 digits)
-        import re
-        timestamp_clean = re.sub(r'\.\d{3}|\D+', '', timestamp)
+        timestamp_clean = timestamp[:-5].replace('-', '').replace('T', '').replace(':', '')
 
         # Concatenate: requestId + timestamp (without millis) + signKey
-        data = f"{request_id}{timestamp_clean}{self.config.user['signKey']}"
+        data = request_id.encode('ascii') + timestamp_clean.encode('ascii') + self.config.sign_key_bytes
 
         # SHA3-512 hash
-        hash_obj = hashlib.sha3_512(data.encode('utf-8'))
-        signature = hash_obj.hexdigest().upper()
+        signature = hashlib.sha3_512(data).hexdigest().upper()
 
         return signature
 
-    def _build_common_header(self, request_id: str, timestamp: str) -> ET.Element:
-        """Build common header for all requests"""
-        header = ET.Element('header')
-
-        ET.SubElement(header, 'requestId').text = request_id
-        ET.SubElement(header, 'timestamp').text = timestamp
-        ET.SubElement(header, 'requestVersion').text = '3.0'
-        ET.SubElement(header, 'headerVersion').text = '1.0'
-
-        return header
-
-    def _build_user_element(self, request_id: str, timestamp: str) -> ET.Element:
-        """Build user authentication element"""
-        user = ET.Element('user')
-
-        ET.SubElement(user, 'login').text = self.config.user['login']
-
-        # Password hash: SHA-512(password)
-        password_hash = hashlib.sha512(self.config.user['password'].encode('utf-8')).hexdigest().upper()
-        password_hash_elem = ET.SubElement(user, 'passwordHash')
-        password_hash_elem.text = password_hash
-        password_hash_elem.set('cryptoType', 'SHA-512')
-
-        ET.SubElement(user, 'taxNumber').text = self.config.user['taxNumber']
+    def _build_common_header(self, request_id: str, timestamp: str) -> str:
+        """Build common header XML for all requests"""
+        return (
+            '<common:header>'
+            f'<common:requestId>{request_id}</common:requestId>'
+            f'<common:timestamp>{timestamp}</common:timestamp>'
+            '<common:requestVersion>3.0</common:requestVersion>'
+            '<common:headerVersion>1.0</common:headerVersion>'
+            '</common:header>'
+        )
 
+    def _build_user_element(self, request_id: str, timestamp: str) -> str:
+        """Build user authentication XML"""
         # Request signature (SHA3-512)
         signature = self._create_request_signature(request_id, timestamp)
-        signature_elem = ET.SubElement(user, 'requestSignature')
-        signature_elem.text = signature
-        signature_elem.set('cryptoType', 'SHA3-512')
-
-        return user
 
-    def _build_software_element(self) -> ET.Element:
-        """Build software identification element"""
-        software = ET.Element('software')
-
-        for key, value in self.config.software.items():
-            ET.SubElement(software, key).text = str(value)
+        return (
+            '<common:user>'
+            f'<common:login>{escape(self.config.user["login"])}</common:login>'
+            f'<common:passwordHash cryptoType="SHA-512">{self.config.password_hash_sha512}</common:passwordHash>'
+            f'<common:taxNumber>{escape(self.config.user["taxNumber"])}</common:taxNumber>'
+            f'<common:requestSignature cryptoType="SHA3-512">{signature}</common:requestSignature>'
+            '</common:user>'
+        )
 
-        return software
+    def _build_software_element(self) -> str:
+        """Build software identification XML"""
+        children = ''.join(
+            f'<{key}>{escape(str(value))}</{key}>' for key, value in self.config.software.items()
+        )
+        return f'<software>{children}</software>'
 
     def query_invoice_digest(
         self,
@@ -236,123 +361,109 @@ class NavOnlineInvoiceReporter:
         request_id = self._generate_request_id()
         timestamp = self._get_timestamp()
 
-        # Build XML request with proper namespaces
-        # Root element
-        root = ET.Element('QueryInvoiceDigestRequest')
-        root.set('xmlns', 'http://schemas.nav.gov.hu/OSA/3.0/api')
-        root.set('xmlns:common', 'http://schemas.nav.gov.hu/NTCA/1.0/common')
-
-        # Add common elements (with common: namespace prefix)
-        header = self._build_common_header(request_id, timestamp)
-        # Re-register all children with common namespace
-        for child in header:
-            child.tag = f'{{http://schemas.nav.gov.hu/NTCA/1.0/common}}{child.tag}'
-        header.tag = '{http://schemas.nav.gov.hu/NTCA/1.0/common}header'
-        root.append(header)
-
-        user = self._build_user_element(request_id, timestamp)
-        # Re-register all children with common namespace
-        for child in user:
-            child.tag = f'{{http://schemas.nav.gov.hu/NTCA/1.0/common}}{child.tag}'
-        user.tag = '{http://schemas.nav.gov.hu/NTCA/1.0/common}user'
-        root.append(user)
-
-        software = self._build_software_element()
-        root.append(software)
-
-        # Add page
-        ET.SubElement(root, 'page').text = str(page)
-
-        # Add invoice direction
-        ET.SubElement(root, 'invoiceDirection').text = direction
-
-        # Add query params
-        query_params_elem = ET.SubElement(root, 'invoiceQueryParams')
-        self._dict_to_xml(invoice_query_params, query_params_elem)
-
-        # Convert to string
-        xml_str = ET.tostring(root, encoding='utf-8', xml_declaration=True).decode('utf-8')
-
-        # Send request
-        response_root = self.connector.post('/queryInvoiceDigest', xml_str, request_id)
+        # Build XML request directly as a string: the message shape is fixed,
+        # so there is no need to build an ElementTree and rewrite its tags
+        xml_str = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<QueryInvoiceDigestRequest xmlns="{NS_API}" xmlns:common="{NS_COMMON}">'
+            f'{self._build_common_header(request_id, timestamp)}'
+            f'{self._build_user_element(request_id, timestamp)}'
+            f'{self._software_xml_str}'
+            f'<page>{page}</page>'
+            f'<invoiceDirection>{escape(direction)}</invoiceDirection>'
+            f'<invoiceQueryParams>{self._dict_to_xml(invoice_query_params)}</invoiceQueryParams>'
+            '</QueryInvoiceDigestRequest>'
+        )
 
-        # Parse response
+        # Send request and parse the response as it streams in
         result = {}
-
-        # Find invoiceDigestResult element
-        digest_result = response_root.find('.//{*}invoiceDigestResult')
-        if digest_result is not None:
-            current_page = digest_result.find('.//{*}currentPage')
-            available_page = digest_result.find('.//{*}availablePage')
-
-            result['currentPage'] = int(current_page.text) if current_page is not None else page
-            result['availablePage'] = int(available_page.text) if available_page is not None else page
-
-            # Parse invoice digest items
-            invoices = []
-            for digest_elem in digest_result.findall('.//{*}invoiceDigest'):
-                invoice = self._xml_to_dict(digest_elem)
-                invoices.append(invoice)
-
+        invoices = []
+        has_digest_result = False
+
+        for elem in self.connector.post_stream('/queryInvoiceDigest', xml_str, request_id):
+            tag = elem.tag.rpartition('}')[2]
+            if tag == 'invoiceDigest':
+                invoices.append(self._xml_to_dict(elem))
+                elem.clear()  # Free the subtree once converted
+            elif tag == 'currentPage':
+                result['currentPage'] = int(elem.text)
+            elif tag == 'availablePage':
+                result['availablePage'] = int(elem.text)
+            elif tag == 'invoiceDigestResult':
+                has_digest_result = True
+
+        if has_digest_result:
+            result.setdefault('currentPage', page)
+            result.setdefault('availablePage', page)
             result['invoiceDigest'] = invoices
+        else:
+            result = {}
 
         return result
 
-    def _dict_to_xml(self, data: Dict[str, Any], parent: ET.Element):
-        """Convert dict to XML elements recursively"""
+    def _dict_to_xml(self, data: Dict[str, Any]) -> str:
+        """Convert dict to XML elements string recursively"""
+        parts = []
         for key, value in data.items():
             if isinstance(value, dict):
-                child = ET.SubElement(parent, key)
-                self._dict_to_xml(value, child)
+                parts.append(f'<{key}>{self._dict_to_xml(value)}</{key}>')
             elif isinstance(value, list):
                 for item in value:
                     if isinstance(item, dict):
-                        child = ET.SubElement(parent, key)
-                        self._dict_to_xml(item, child)
+                        parts.append(f'<{key}>{self._dict_to_xml(item)}</{key}>')
                     else:
-                        ET.SubElement(parent, key).text = str(item)
+                        parts.append(f'<{key}>{escape(str(item))}</{key}>')
             else:
-                ET.SubElement(parent, key).text = str(value)
+                parts.append(f'<{key}>{escape(str(value))}</{key}>')
+        return ''.join(parts)
 
     def _xml_to_dict(self, element: ET.Element) -> Dict[str, Any]:
-        """Convert XML element to dict recursively"""
-        result = {}
-
-        # Get tag name without namespace
-        tag = element.tag.split('}')[-1] if '}' in element.tag else element.tag
+        """Convert XML element to dict (iteratively, without recursion)"""
+        # Leaf node - return text content
+        if not len(element):
+            return element.text
 
-        # If element has children, recurse
-        if len(element):
-            for child in element:
-                child_tag = child.tag.split('}')[-1] if '}' in child.tag else child.tag
-                child_data = self._xml_to_dict(child)
+        result = {}
+        stack = [(element, result)]
+        while stack:
+            elem, out = stack.pop()
+            for child in elem:
+                # Get tag name without namespace
+                child_tag = child.tag.rpartition('}')[2]
+
+                if len(child):
+                    child_data = {}
+                    stack.append((child, child_data))
+                else:
+                    child_data = child.text
 
                 # Handle multiple children with same tag
-                if child_tag in result:
-                    if not isinstance(result[child_tag], list):
-                        result[child_tag] = [result[child_tag]]
-                    result[child_tag].append(child_data)
+                if child_tag in out:
+                    existing = out[child_tag]
+                    if isinstance(existing, list):
+                        existing.append(child_data)
+                    else:
+                        out[child_tag] = [existing, child_data]
                 else:
-                    result[child_tag] = child_data
-        else:
-            # Leaf node - return text content
-            return element.text
+                    out[child_tag] = child_data
 
         return result
 
 
+@functools.lru_cache(maxsize=1024)
 def normalize_tax_number(raw_tax_number: str) -> Optional[str]:
     """
     Normalize Hungarian tax number to 8 digits
 
+    Results are memoized; the same users' tax numbers are normalized on
+    every sync and query.
+
     Args:
         raw_tax_number: Raw tax number (may include HU prefix, dashes, etc.)
 
     Returns:
         8-digit tax number or None if invalid
     """
-    import re
-
     s = raw_tax_number.upper().strip()
 
     # Remove HU prefix
@@ -360,12 +471,12 @@ def normalize_tax_number(raw_tax_number: str) -> Optional[str]:
         s = s[2:]
 
     # Find first 8 consecutive digits
-    match = re.search(r'(\d{8})', s)
+    match = _TAX_DIGITS_RE.search(s)
     if match:
         return match.group(1)
 
     # Remove all non-digits and take first 8
-    only_digits = re.sub(r'\D+', '', s)
+    only_digits = _NON_DIGIT_RE.sub('', s)
     if len(only_digits) >= 8:
         return only_digits[:8]
 
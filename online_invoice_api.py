@@ -11,10 +11,23 @@ Supports three modes:
 """
 
 import os
+import calendar
+import functools
+import hmac
+import json
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
-from flask import request, jsonify
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Iterator
+from flask import Response, request, jsonify, stream_with_context
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to stdlib json
+    orjson = None
 
 from nav_online_invoice import (
     NavOnlineInvoiceConfig,
@@ -38,6 +51,38 @@ VALID_API_KEYS = {
     }
 }
 
+# Software data sent to NAV (fixed values, shared read-only by all requests)
+SOFTWARE_DATA = MappingProxyType({
+    "softwareId": "123456789123456789",
+    "softwareName": "string",
+    "softwareOperation": "ONLINE_SERVICE",
+    "softwareMainVersion": "string",
+    "softwareDevName": "string",
+    "softwareDevContact": "string",
+    "softwareDevCountryCode": "HU",
+    "softwareDevTaxNumber": "string"
+})
+
+# Pre-encoded API keys for constant-time comparison
+_API_KEY_BYTES = tuple((key.encode('utf-8'), info) for key, info in VALID_API_KEYS.items())
+
+
+# Concurrent monthly NAV queries (kept low to respect NAV rate limits)
+MONTHLY_QUERY_WORKERS = int(os.getenv('MONTHLY_QUERY_WORKERS', '4'))
+# Concurrent page fetches once the first page reports availablePage
+PAGE_PREFETCH_WORKERS = 3
+# Invoices serialized per chunk when streaming the normal-mode response
+STREAM_CHUNK_SIZE = 500
+
+# In-process cache of paginated NAV results:
+# (taxNumber, login, passwordHash, dateFrom, dateTo) -> (stored_at, invoices)
+INVOICE_CACHE_TTL = float(os.getenv('INVOICE_CACHE_TTL', '600'))  # 0 disables caching
+# Total invoices held across all entries (per worker process); larger results are not cached
+INVOICE_CACHE_MAX_INVOICES = int(os.getenv('INVOICE_CACHE_MAX_INVOICES', '20000'))
+_invoice_cache: Dict[tuple, Tuple[float, List[Dict[str, Any]]]] = {}
+_invoice_cache_size = 0  # Invoices currently held in _invoice_cache
+_invoice_cache_lock = threading.Lock()
+
 
 # Hungarian month names
 HUNGARIAN_MONTHS = {
@@ -54,6 +99,20 @@ ENGLISH_MONTHS = {
 }
 
 
+def _year(date_str: str) -> int:
+    """Year of a YYYY-MM-DD date string (sliced, no datetime parsing)"""
+    if len(date_str) == 10 and date_str[4] == date_str[7] == '-':
+        return int(date_str[:4])
+    return datetime.fromisoformat(date_str).year
+
+
+def _month(date_str: str) -> int:
+    """Month of a YYYY-MM-DD date string (sliced, no datetime parsing)"""
+    if len(date_str) == 10 and date_str[4] == date_str[7] == '-':
+        return int(date_str[5:7])
+    return datetime.fromisoformat(date_str).month
+
+
 def mask_sensitive_data(data: Dict[str, Any]) -> Dict[str, Any]:
     """Mask sensitive data (password) in dict for logging"""
     masked = data.copy()
@@ -76,10 +135,53 @@ def validate_api_key() -> Optional[Dict[str, str]]:
     if not api_key:
         api_key = request.args.get('apiKey')
 
-    if not api_key or api_key not in VALID_API_KEYS:
+    if not api_key:
         return None
 
-    return VALID_API_KEYS[api_key]
+    supplied = api_key.encode('utf-8')
+    for key, info in _API_KEY_BYTES:
+        if hmac.compare_digest(key, supplied):
+            return info
+
+    return None
+
+
+def iter_invoice_pages(
+    reporter: NavOnlineInvoiceReporter,
+    invoice_query_params: Dict[str, Any],
+    max_pages: int = 100
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Query invoices page by page, yielding each page's invoices in page order
+
+    Args:
+        reporter: NAV reporter instance
+        invoice_query_params: Query parameters
+        max_pages: Maximum pages to fetch
+
+    Yields:
+        List of invoice dicts of one page
+    """
+    def fetch_page(page: int) -> Dict[str, Any]:
+        logger.info(f"Querying page {page}...")
+        result = reporter.query_invoice_digest(invoice_query_params, page, "OUTBOUND")
+        invoices = result.get('invoiceDigest', [])
+        if invoices:
+            logger.info(f"Found {len(invoices)} invoices on page {page}")
+        return result
+
+    # First page tells how many pages there are
+    result = fetch_page(1)
+    yield result.get('invoiceDigest', [])
+
+    available_pages = min(result.get('availablePage', 1), max_pages)
+    logger.info(f"Available pages: {available_pages}")
+
+    # Fetch the remaining pages concurrently, yielded back in page order
+    if available_pages > 1:
+        with ThreadPoolExecutor(max_workers=PAGE_PREFETCH_WORKERS) as executor:
+            for result in executor.map(fetch_page, range(2, available_pages + 1)):
+                yield result.get('invoiceDigest', [])
 
 
 def query_all_invoices_paginated(
@@ -98,37 +200,167 @@ def query_all_invoices_paginated(
     Returns:
         List of all invoice dicts
     """
-    page = 1
     all_invoices = []
+    for invoices in iter_invoice_pages(reporter, invoice_query_params, max_pages):
+        all_invoices.extend(invoices)
 
-    while page <= max_pages:
-        logger.info(f"Querying page {page}...")
+    logger.info(f"Total invoices fetched: {len(all_invoices)}")
+    return all_invoices
 
-        result = reporter.query_invoice_digest(invoice_query_params, page, "OUTBOUND")
 
-        invoices = result.get('invoiceDigest', [])
-        if invoices:
-            logger.info(f"Found {len(invoices)} invoices on page {page}")
-            all_invoices.extend(invoices)
+def cached_query_all_invoices(
+    reporter: NavOnlineInvoiceReporter,
+    invoice_query_params: Dict[str, Any],
+    use_cache: bool = True
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Query all invoices with pagination, reusing recent results
 
-        available_pages = result.get('availablePage', 1)
-        logger.info(f"Available pages: {available_pages}")
+    Results are cached for INVOICE_CACHE_TTL seconds per tax number,
+    credentials and issue date range, up to INVOICE_CACHE_MAX_INVOICES
+    invoices in total (oldest entries are evicted first). The returned list
+    is shared with the cache and must not be modified.
 
-        if page >= available_pages:
-            break
+    Args:
+        reporter: NAV reporter instance
+        invoice_query_params: Query parameters
+        use_cache: Reuse a cached result (False always queries NAV, then refreshes the cache)
+
+    Returns:
+        Tuple of (list of all invoice dicts, whether it came from the cache)
+    """
+    issue_date = invoice_query_params['mandatoryQueryParams']['invoiceIssueDate']
+    user = reporter.config.user
+    key = (
+        user['taxNumber'],
+        user['login'],
+        reporter.config.password_hash_sha512,
+        issue_date['dateFrom'],
+        issue_date['dateTo'],
+    )
+
+    if use_cache and INVOICE_CACHE_TTL > 0:
+        with _invoice_cache_lock:
+            cached = _invoice_cache.get(key)
+        if cached and time.monotonic() - cached[0] < INVOICE_CACHE_TTL:
+            logger.info(f"Using cached invoices for {issue_date['dateFrom']} - {issue_date['dateTo']}")
+            return cached[1], True
+
+    invoices = query_all_invoices_paginated(reporter, invoice_query_params)
+
+    if INVOICE_CACHE_TTL > 0:
+        _store_cached_invoices(key, invoices)
+
+    return invoices, False
+
+
+def _store_cached_invoices(key: tuple, invoices: List[Dict[str, Any]]) -> None:
+    """Cache one query result, evicting the oldest entries to stay within INVOICE_CACHE_MAX_INVOICES"""
+    global _invoice_cache_size
+    with _invoice_cache_lock:
+        previous = _invoice_cache.pop(key, None)
+        if previous is not None:
+            _invoice_cache_size -= len(previous[1])
+        if len(invoices) > INVOICE_CACHE_MAX_INVOICES:
+            return
+        _invoice_cache[key] = (time.monotonic(), invoices)
+        _invoice_cache_size += len(invoices)
+        # Evict the oldest entries (dicts keep insertion order)
+        while _invoice_cache_size > INVOICE_CACHE_MAX_INVOICES:
+            _, evicted = _invoice_cache.pop(next(iter(_invoice_cache)))
+            _invoice_cache_size -= len(evicted)
+
+
+@functools.lru_cache(maxsize=16)
+def month_date_ranges(year: int) -> Tuple[Tuple[str, str], ...]:
+    """
+    First and last day of every month of a year
 
-        page += 1
+    Args:
+        year: Year
 
-    logger.info(f"Total invoices fetched: {len(all_invoices)}")
-    return all_invoices
+    Returns:
+        Tuple of 12 (dateFrom, dateTo) pairs in YYYY-MM-DD format
+    """
+    return tuple(
+        (f"{year}-{month:02d}-01", f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}")
+        for month in range(1, 13)
+    )
 
 
-def calculate_summary(invoices: List[Dict[str, Any]], current_year: int) -> Dict[str, Any]:
+def query_month_summary(reporter: NavOnlineInvoiceReporter, year: int, month: int,
+                        use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Query all invoices issued in one calendar month and summarize them
+
+    Args:
+        reporter: NAV reporter instance
+        year: Year of the month
+        month: Month number (1-12)
+        use_cache: Reuse a cached NAV result (see cached_query_all_invoices)
+
+    Returns:
+        Summary dict as returned by calculate_summary
+    """
+    date_from, date_to = month_date_ranges(year)[month - 1]
+
+    logger.info(f"Querying month {month} from {date_from} to {date_to}")
+
+    invoice_query_params = {
+        "mandatoryQueryParams": {
+            "invoiceIssueDate": {
+                "dateFrom": date_from,
+                "dateTo": date_to,
+            },
+        },
+    }
+
+    monthly_invoices, _ = cached_query_all_invoices(reporter, invoice_query_params, use_cache=use_cache)
+    logger.info(f"Finished querying month {month}. Total invoices: {len(monthly_invoices)}")
+
+    return calculate_summary(monthly_invoices, year)
+
+
+def iter_monthly_summaries(
+    reporter: NavOnlineInvoiceReporter,
+    year: int,
+    max_concurrency: int = MONTHLY_QUERY_WORKERS,
+    use_cache: bool = True
+) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[Exception]]]:
+    """
+    Query and summarize the 12 months of a year concurrently
+
+    The monthly NAV queries are network bound, so a small thread pool
+    overlaps their round-trips. Results are yielded in month order; a failed
+    month yields its exception instead of stopping the other months.
+
+    Args:
+        reporter: NAV reporter instance
+        year: Year to query
+        max_concurrency: Maximum number of months queried at once
+        use_cache: Reuse cached NAV results (False for syncs that write to Adalo)
+
+    Yields:
+        Tuple of (month number, summary dict or None, exception or None)
+    """
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = [
+            executor.submit(query_month_summary, reporter, year, month, use_cache)
+            for month in range(1, 13)
+        ]
+        for month, future in enumerate(futures, 1):
+            try:
+                yield month, future.result(), None
+            except Exception as ex:
+                yield month, None, ex
+
+
+def calculate_summary(invoices: Iterable[Dict[str, Any]], current_year: int) -> Dict[str, Any]:
     """
     Calculate summary statistics from invoices
 
     Args:
-        invoices: List of invoice dicts
+        invoices: Invoice dicts (any iterable, consumed in a single pass)
         current_year: Current year for cross-year detection
 
     Returns:
@@ -142,24 +374,22 @@ def calculate_summary(invoices: List[Dict[str, Any]], current_year: int) -> Dict
     modified_invoices = 0
     cross_year_stornos = 0
     cross_year_modified = 0
+    invoice_count = 0
 
     for invoice in invoices:
-        amount = float(invoice.get('invoiceNetAmountHUF', 0))
+        invoice_count += 1
         operation = invoice.get('invoiceOperation', 'CREATE')
 
         # Check if cross-year (delivery date in previous year)
         is_cross_year = False
-        if operation in ['STORNO', 'MODIFY']:
+        if operation in ('STORNO', 'MODIFY'):
             delivery_date = invoice.get('invoiceDeliveryDate')
-            if delivery_date:
-                try:
-                    delivery_year = int(delivery_date[:4])
-                    if delivery_year < current_year:
-                        is_cross_year = True
-                except:
-                    pass
+            if isinstance(delivery_date, str) and delivery_date[:4].isdecimal():
+                is_cross_year = int(delivery_date[:4]) < current_year
 
         if not is_cross_year:
+            # Amount is only needed for invoices counted in this year's totals
+            amount = float(invoice.get('invoiceNetAmountHUF', 0))
             if operation == 'STORNO':
                 storno_amount += abs(amount)
                 storno_invoices += 1
@@ -186,12 +416,46 @@ def calculate_summary(invoices: List[Dict[str, Any]], current_year: int) -> Dict
         'validInvoices': valid_invoices,
         'stornoInvoices': storno_invoices,
         'modifiedInvoices': modified_invoices,
-        'totalInvoices': len(invoices),
+        'totalInvoices': invoice_count,
         'crossYearStornos': cross_year_stornos,
         'crossYearModified': cross_year_modified
     }
 
 
+def _json_dumps(obj: Any) -> bytes:
+    """Encode obj as compact JSON bytes with sorted keys (orjson when available)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+def _json_response(payload: Dict[str, Any]) -> Response:
+    """Build a JSON response without going through flask.jsonify"""
+    return Response(_json_dumps(payload), mimetype='application/json')
+
+
+def stream_invoices_json(invoices: List[Dict[str, Any]], cached: bool) -> Iterator[bytes]:
+    """
+    Serialize the normal-mode response body in chunks
+
+    Produces the same object as {'success', 'count', 'invoices', 'cached'}
+    but never builds the whole (possibly multi-MB) JSON string at once.
+
+    Args:
+        invoices: List of invoice dicts
+        cached: Whether the invoices came from the cache
+
+    Yields:
+        Consecutive pieces of the JSON document
+    """
+    yield f'{{"cached":{json.dumps(cached)},"count":{len(invoices)},"invoices":['.encode('utf-8')
+    for start in range(0, len(invoices), STREAM_CHUNK_SIZE):
+        # Encode a slice as one array and drop its brackets
+        chunk = _json_dumps(invoices[start:start + STREAM_CHUNK_SIZE])[1:-1]
+        yield (b',' + chunk) if start else chunk
+    yield b'],"success":true}'
+
+
 def handle_online_invoice_query():
     """
     Main handler for online invoice queries
@@ -210,13 +474,16 @@ def handle_online_invoice_query():
 
         logger.info(f"API key valid: {api_key_info['name']}")
 
-        # Get request data (POST JSON or GET params)
+        # Get request data (POST JSON or GET params, never mixed)
         if request.method == 'POST':
-            request_data = request.get_json(silent=True) or {}
-            logger.info(f"POST data (safe): {mask_sensitive_data(request_data)}")
+            # Some clients label JSON as text/json, which Flask does not treat as JSON by itself
+            request_data = request.get_json(silent=True, force=request.mimetype == 'text/json') or {}
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("POST data (safe): %s", mask_sensitive_data(request_data))
         else:
             request_data = request.args.to_dict()
-            logger.info(f"GET params (safe): {mask_sensitive_data(request_data)}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("GET params (safe): %s", mask_sensitive_data(request_data))
 
         # Normalize tax number
         if 'taxNumber' in request_data:
@@ -249,21 +516,9 @@ def handle_online_invoice_query():
             "exchangeKey": request_data['exchangeKey']
         }
 
-        # Build software data (fixed values)
-        software_data = {
-            "softwareId": "123456789123456789",
-            "softwareName": "string",
-            "softwareOperation": "ONLINE_SERVICE",
-            "softwareMainVersion": "string",
-            "softwareDevName": "string",
-            "softwareDevContact": "string",
-            "softwareDevCountryCode": "HU",
-            "softwareDevTaxNumber": "string"
-        }
-
         # Create NAV client
         logger.info("Creating NAV Online Invoice client...")
-        config = NavOnlineInvoiceConfig(NavOnlineInvoiceConfig.PROD_URL, user_data, software_data)
+        config = NavOnlineInvoiceConfig(NavOnlineInvoiceConfig.PROD_URL, user_data, SOFTWARE_DATA)
         reporter = NavOnlineInvoiceReporter(config)
         logger.info("NAV client created successfully")
 
@@ -284,15 +539,15 @@ def handle_online_invoice_query():
 
         # Fetch all invoices with pagination
         logger.info(f"Fetching invoices from {request_data['dateFrom']} to {request_data['dateTo']}")
-        all_invoices = query_all_invoices_paginated(reporter, invoice_query_params)
+        all_invoices, cached = cached_query_all_invoices(reporter, invoice_query_params)
 
         # Check if summary is requested
         if request_data.get('summary') == 'true':
             logger.info("Summary mode requested")
 
             # Determine current year/month from dateFrom
-            current_year = int(datetime.fromisoformat(request_data['dateFrom']).year)
-            current_month = int(datetime.fromisoformat(request_data['dateFrom']).month)
+            current_year = _year(request_data['dateFrom'])
+            current_month = _month(request_data['dateFrom'])
             current_month_name = HUNGARIAN_MONTHS[current_month]
 
             summary = calculate_summary(all_invoices, current_year)
@@ -304,20 +559,19 @@ def handle_online_invoice_query():
             response = {
                 'success': True,
                 'summary': summary,
-                'cached': False
+                'cached': cached
             }
         else:
-            # Normal mode - return all invoices
+            # Normal mode - return all invoices, serialized as the body is sent
             logger.info("Normal mode - returning all invoices")
-            response = {
-                'success': True,
-                'count': len(all_invoices),
-                'invoices': all_invoices,
-                'cached': False
-            }
+            logger.info("Request completed successfully")
+            return Response(
+                stream_with_context(stream_invoices_json(all_invoices, cached)),
+                mimetype='application/json'
+            ), 200
 
         logger.info("Request completed successfully")
-        return jsonify(response), 200
+        return _json_response(response), 200
 
     except Exception as ex:
         logger.error(f"Error processing request: {str(ex)}", exc_info=True)
@@ -338,7 +592,7 @@ def handle_yearly_summary(reporter: NavOnlineInvoiceReporter, request_data: Dict
     Returns:
         Tuple of (response dict, status code)
     """
-    year = datetime.fromisoformat(request_data['dateFrom']).year
+    year = _year(request_data['dateFrom'])
 
     yearly_summary = {
         'totalAmount': 0.0,
@@ -353,35 +607,13 @@ def handle_yearly_summary(reporter: NavOnlineInvoiceReporter, request_data: Dict
         'crossYearModified': 0
     }
 
-    # Query each month
-    for month in range(1, 13):
-        date_from = f"{year}-{month:02d}-01"
-        # Get last day of month
-        if month == 12:
-            date_to = f"{year}-12-31"
-        else:
-            next_month = datetime(year, month + 1, 1)
-            last_day = (next_month - timedelta(days=1)).day
-            date_to = f"{year}-{month:02d}-{last_day:02d}"
-
+    # Query all months concurrently, merged in month order
+    for month, monthly_summary, error in iter_monthly_summaries(reporter, year):
         month_name = ENGLISH_MONTHS[month]
-        logger.info(f"Querying month {month} ({month_name}) from {date_from} to {date_to}")
 
         try:
-            invoice_query_params = {
-                "mandatoryQueryParams": {
-                    "invoiceIssueDate": {
-                        "dateFrom": date_from,
-                        "dateTo": date_to,
-                    },
-                },
-            }
-
-            monthly_invoices = query_all_invoices_paginated(reporter, invoice_query_params)
-            logger.info(f"Finished querying month {month}. Total invoices: {len(monthly_invoices)}")
-
-            # Calculate monthly summary
-            monthly_summary = calculate_summary(monthly_invoices, year)
+            if error is not None:
+                raise error
 
             # Add to yearly summary
             yearly_summary[f'{month_name}TotalAmount'] = monthly_summary['totalAmount']
@@ -426,4 +658,4 @@ def handle_yearly_summary(reporter: NavOnlineInvoiceReporter, request_data: Dict
     }
 
     logger.info(f"Finished yearly processing. Total invoices: {yearly_summary['totalInvoices']}")
-    return jsonify(response), 200
+    return _json_response(response), 200
@@ -4,6 +4,7 @@ Online Invoice Sync Service
 Syncs Online Invoice data to Adalo user records (monthly aggregations).
 """
 
+import calendar
 import logging
 import math
 from datetime import datetime
@@ -15,8 +16,8 @@ from nav_online_invoice import (
     normalize_tax_number
 )
 from online_invoice_api import (
-    query_all_invoices_paginated,
-    calculate_summary,
+    iter_monthly_summaries,
+    SOFTWARE_DATA,
     HUNGARIAN_MONTHS
 )
 
@@ -36,6 +37,17 @@ ADALO_MONTH_NAMES = {
     11: 'nov',  # Special case: 'novincoices' (typo in Adalo)
     12: 'dec'
 }
+
+# Per-month Adalo field names: (net, invoice count, KATA percent)
+# November's invoice count field has a typo in Adalo: 'novincoices'
+ADALO_MONTH_FIELDS = {
+    month: (
+        f'{name}net',
+        'novincoices' if month == 11 else f'{name}invoices',
+        f'{name}katapercent'
+    )
+    for month, name in ADALO_MONTH_NAMES.items()
+}
 from adalo_client import AdaloClient
 
 logger = logging.getLogger(__name__)
@@ -94,19 +106,8 @@ def sync_online_invoice_for_user(user: Dict[str, Any], adalo_client: AdaloClient
             "exchangeKey": user['exchangeKey']
         }
 
-        software_data = {
-            "softwareId": "123456789123456789",
-            "softwareName": "string",
-            "softwareOperation": "ONLINE_SERVICE",
-            "softwareMainVersion": "string",
-            "softwareDevName": "string",
-            "softwareDevContact": "string",
-            "softwareDevCountryCode": "HU",
-            "softwareDevTaxNumber": "string"
-        }
-
         # Create NAV client
-        config = NavOnlineInvoiceConfig(NavOnlineInvoiceConfig.PROD_URL, user_data, software_data)
+        config = NavOnlineInvoiceConfig(NavOnlineInvoiceConfig.PROD_URL, user_data, SOFTWARE_DATA)
         reporter = NavOnlineInvoiceReporter(config)
 
         # KATA limits (2025)
@@ -179,32 +180,15 @@ def sync_online_invoice_for_user(user: Dict[str, Any], adalo_client: AdaloClient
         except Exception as ex:
             logger.warning(f"Could not fetch OPG revenues: {ex}, continuing without OPG data")
 
-        # Query each month
-        for month in range(1, 13):
-            date_from = f"{year}-{month:02d}-01"
-            # Get last day of month
-            if month == 12:
-                date_to = f"{year}-12-31"
-            else:
-                import calendar
-                last_day = calendar.monthrange(year, month)[1]
-                date_to = f"{year}-{month:02d}-{last_day:02d}"
-
+        # Query all months concurrently, merged in month order. Fresh NAV data only:
+        # these totals are written to Adalo, so cached query results are not reused.
+        for month, monthly_summary, error in iter_monthly_summaries(reporter, year, use_cache=False):
             adalo_month_name = ADALO_MONTH_NAMES[month]
-            logger.info(f"  Querying month {month} ({date_from} to {date_to})...")
+            net_field, invoices_field, kata_field = ADALO_MONTH_FIELDS[month]
 
             try:
-                invoice_query_params = {
-                    "mandatoryQueryParams": {
-                        "invoiceIssueDate": {
-                            "dateFrom": date_from,
-                            "dateTo": date_to,
-                        },
-                    },
-                }
-
-                monthly_invoices = query_all_invoices_paginated(reporter, invoice_query_params)
-                monthly_summary = calculate_summary(monthly_invoices, year)
+                if error is not None:
+                    raise error
 
                 # Get OPG revenue for this month
                 opg_monthly_revenue = opg_monthly_revenues.get(month, 0.0)
@@ -224,7 +208,6 @@ def sync_online_invoice_for_user(user: Dict[str, Any], adalo_client: AdaloClient
                         monthly_kata_limit = 0.0
                     elif month == start_month:
                         # First month - prorate by days
-                        import calendar
                         days_in_month = calendar.monthrange(year, month)[1]
                         days_worked = days_in_month - start_day + 1  # +1 to include start day
                         monthly_kata_limit = (days_worked / days_in_month) * BASE_KATA_MONTHLY_LIMIT
@@ -237,15 +220,9 @@ def sync_online_invoice_for_user(user: Dict[str, Any], adalo_client: AdaloClient
                     monthly_kata_percent = 0
 
                 # Update monthly fields (using Adalo field names)
-                update_data[f'{adalo_month_name}net'] = monthly_summary['netAmount']
-
-                # Special case: November has typo in Adalo field name
-                if month == 11:
-                    update_data['novincoices'] = monthly_summary['totalInvoices']  # Typo in Adalo!
-                else:
-                    update_data[f'{adalo_month_name}invoices'] = monthly_summary['totalInvoices']
-
-                update_data[f'{adalo_month_name}katapercent'] = monthly_kata_percent
+                update_data[net_field] = monthly_summary['netAmount']
+                update_data[invoices_field] = monthly_summary['totalInvoices']
+                update_data[kata_field] = monthly_kata_percent
 
                 total_invoices += monthly_summary['totalInvoices']
                 total_online_invoice_net += monthly_summary['netAmount']
@@ -255,15 +232,9 @@ def sync_online_invoice_for_user(user: Dict[str, Any], adalo_client: AdaloClient
             except Exception as ex:
                 logger.error(f"  Error querying month {month}: {str(ex)}")
                 # Set to 0 on error
-                update_data[f'{adalo_month_name}net'] = 0.0
-
-                # Special case: November has typo in Adalo field name
-                if month == 11:
-                    update_data['novincoices'] = 0  # Typo in Adalo!
-                else:
-                    update_data[f'{adalo_month_name}invoices'] = 0
-
-                update_data[f'{adalo_month_name}katapercent'] = 0
+                update_data[net_field] = 0.0
+                update_data[invoices_field] = 0
+                update_data[kata_field] = 0
 
         # Calculate total revenue (OPG + Online Invoice)
         total_opg_revenue = sum(opg_monthly_revenues.values())
@@ -284,9 +255,9 @@ def sync_online_invoice_for_user(user: Dict[str, Any], adalo_client: AdaloClient
         # Update current month info
         current_month = datetime.now().month
         current_month_name_hu = HUNGARIAN_MONTHS[current_month]
-        current_month_adalo = ADALO_MONTH_NAMES[current_month]
+        current_month_net_field = ADALO_MONTH_FIELDS[current_month][0]
         update_data['currentMonth_name'] = current_month_name_hu
-        update_data['currentMonth_amount'] = update_data.get(f'{current_month_adalo}net', 0.0)
+        update_data['currentMonth_amount'] = update_data.get(current_month_net_field, 0.0)
 
         # Update user record in Adalo
         logger.info(f"Updating user {user_id} with Online Invoice data...")
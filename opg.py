@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import argparse, datetime as dt, hashlib, uuid, requests, os, re, zipfile, subprocess
+import argparse, datetime as dt, hashlib, requests, os, re, zipfile, subprocess, shutil, mmap
+import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
+from xml.sax.saxutils import escape
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 
 # ==== CRED: hardcoded hitelesítési adatok ===============
@@ -16,23 +22,48 @@ AP_NUMBER       = "A29200455"  # az általad használt AP szám
 
 # ÉLES végpontok
 BASE = "https://api-onlinepenztargep.nav.gov.hu"
+STATUS_URL = f"{BASE}/queryCashRegisterFile/v1/queryCashRegisterStatus"
+FILE_URL = f"{BASE}/queryCashRegisterFile/v1/queryCashRegisterFile"
 # Namespace-ek a minta XML alapján
 NS_API = "http://schemas.nav.gov.hu/OPF/1.0/api"
 NS_COM = "http://schemas.nav.gov.hu/NTCA/1.0/common"
 
+# P7B-ből XML kinyerés mintái (modul szinten fordítva, bytes-on futnak)
+XML_ROWS_RE = re.compile(rb'(<\?xml[^>]*\?>.*?<ROWS\b[^>]*>.*?</ROWS>)', re.DOTALL | re.IGNORECASE)
+XML_ROOT_TAG_RE = re.compile(rb'<\?xml[^>]*\?>\s*<([A-Z][A-Za-z0-9_]*)\b')
+# Multipart fejléc minták
+BOUNDARY_RE = re.compile(r'boundary="?([^";]+)"?', re.I)
+PART_NAME_RE = re.compile(rb'name="?([^";]+)"?', re.I)
+ZIP_CONTENT_TYPE_RE = re.compile(rb'application/(?:octet-stream|zip)', re.I)
+# OpenSSL elérési útja egyszer feloldva (None, ha nincs telepítve)
+OPENSSL_BIN = shutil.which("openssl")
+
+@dataclass(frozen=True)
+class NavConfig:
+    """Egy felhasználó NAV hitelesítési adatai (alapértelmezés: a fenti CLI konstansok)."""
+    tech_login: str = TECH_LOGIN
+    tech_password: str = TECH_PASSWORD
+    signing_key: str = SIGNING_KEY
+    exchange_key: str = EXCHANGE_KEY
+    tax_number_8dig: str = TAX_NUMBER_8DIG
+
 # ---- Hash segédek ----
 def sha512_upper(s: str) -> str:
-    import hashlib
     return hashlib.sha512(s.encode("utf-8")).hexdigest().upper()
 
 def sha3_512_upper(s: str) -> str:
-    import hashlib
     return hashlib.sha3_512(s.encode("utf-8")).hexdigest().upper()
 
-def now_utc_compact() -> str:
-    # A NAV példában ISO 8601 formátum van, nem kompakt!
-    # Példa: 2022-02-01T11:40:44.037Z
-    return dt.datetime.now(dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")[:-4] + "Z"  # mikroszekundumból milliszekundum
+def now_utc_pair() -> tuple[str, str]:
+    # (XML timestamp, signature timestamp) ugyanabból az időpontból
+    # XML: ISO 8601 milliszekundummal, pl. 2022-02-01T11:40:44.037Z
+    # Signature: CSAK MÁSODPERC pontosság, YYYYMMDDHHMMSS (14 karakter), pl. 20220201114044
+    now = dt.datetime.now(dt.timezone.utc)
+    return now.strftime("%Y-%m-%dT%H:%M:%S.%fZ")[:-4] + "Z", now.strftime("%Y%m%d%H%M%S")  # mikroszekundumból milliszekundum
+
+def new_request_id() -> str:
+    # requestId: max 30 karakter, pattern: [+a-zA-Z0-9_]{1,30}
+    return os.urandom(15).hex()  # pontosan 30 hex karakter
 
 def make_headers():
     # SOAP 1.2 használ application/soap+xml-t
@@ -42,7 +73,9 @@ def make_headers():
     }
 
 # ---- SOAP blokkok ----
+@lru_cache(maxsize=None)  # kérésfüggetlen, elég egyszer felépíteni
 def software_block(dev_name="Bruno Szubally", dev_contact="info@example.com", dev_tax="77317012"):
+    dev_name, dev_contact, dev_tax = escape(dev_name), escape(dev_contact), escape(dev_tax)
     return f"""
     <api:software>
       <api:softwareId>HU77317012-PYOPGCL</api:softwareId>
@@ -55,33 +88,29 @@ def software_block(dev_name="Bruno Szubally", dev_contact="info@example.com", de
       <api:softwareDevTaxNumber>{dev_tax}</api:softwareDevTaxNumber>
     </api:software>"""
 
-def user_block(request_id: str, timestamp: str, use_exchange_key=False, debug=False):
-    if not (TECH_LOGIN and TECH_PASSWORD and TAX_NUMBER_8DIG):
+def user_block(request_id: str, timestamp: str, timestamp_for_sig: str, use_exchange_key=False, debug=False,
+               cfg: NavConfig | None = None):
+    cfg = cfg or NavConfig()
+    if not (cfg.tech_login and cfg.tech_password and cfg.tax_number_8dig):
         raise RuntimeError("Hiányos hitelesítési adatok.")
-    pwd_hash = sha512_upper(TECH_PASSWORD)
+    pwd_hash = sha512_upper(cfg.tech_password)
     # Próbáljuk meg mindkét kulcsot
-    key_to_use = EXCHANGE_KEY if use_exchange_key else SIGNING_KEY
+    key_to_use = cfg.exchange_key if use_exchange_key else cfg.signing_key
     # Issue #66: signature számításhoz CSAK MÁSODPERC pontosságú timestamp!
-    # A timestamp paraméter milliszekundumokat tartalmaz (XML-hez), de a signature-höz
-    # másodperc pontosságú verziót kell használni
-    import re
-    # Levágjuk a milliszekundumokat: 2022-02-01T11:40:44.037Z -> 2022-02-01T11:40:44Z
-    timestamp_seconds_only = re.sub(r'\.\d+Z$', 'Z', timestamp)
-    # Tisztítjuk: eltávolítjuk - : Z T karaktereket (kell: YYYYMMDDHHMMSS, 14 karakter)
-    timestamp_for_sig = timestamp_seconds_only.replace("-","").replace(":","").replace("Z","").replace("T","")
+    # A timestamp paraméter milliszekundumokat tartalmaz (XML-hez), a timestamp_for_sig
+    # a now_utc_pair() által előállított YYYYMMDDHHMMSS forma
     req_sig  = sha3_512_upper(request_id + timestamp_for_sig + key_to_use)
     if debug:
         print(f"DEBUG: Signature kulcs: {key_to_use}")
         print(f"DEBUG: Timestamp XML-ben: {timestamp}")
-        print(f"DEBUG: Timestamp másodperc: {timestamp_seconds_only}")
         print(f"DEBUG: Timestamp signature-höz: {timestamp_for_sig} (hossz: {len(timestamp_for_sig)})")
         print(f"DEBUG: Signature bemenet: {request_id + timestamp_for_sig + key_to_use}")
         print(f"DEBUG: Signature: {req_sig}")
     return f"""
     <com:user>
-      <com:login>{TECH_LOGIN}</com:login>
+      <com:login>{escape(cfg.tech_login)}</com:login>
       <com:passwordHash cryptoType="SHA-512">{pwd_hash}</com:passwordHash>
-      <com:taxNumber>{TAX_NUMBER_8DIG}</com:taxNumber>
+      <com:taxNumber>{escape(cfg.tax_number_8dig)}</com:taxNumber>
       <com:requestSignature cryptoType="SHA3-512">{req_sig}</com:requestSignature>
     </com:user>"""
 
@@ -103,145 +132,322 @@ def envelope(inner_xml: str) -> str:
   </soap:Body>
 </soap:Envelope>"""
 
-def build_status_xml(ap: str | None, use_exchange_key=False, debug=False):
-    # requestId: max 30 karakter, pattern: [+a-zA-Z0-9_]{1,30}
-    rid = str(uuid.uuid4()).replace("-", "")[:30]  # UUID kötőjelek nélkül, max 30 kar
-    ts = now_utc_compact()
+def build_status_xml(ap: str | None, use_exchange_key=False, debug=False, cfg: NavConfig | None = None):
+    rid = new_request_id()
+    ts, ts_sig = now_utc_pair()
     ap_xml = f"""
     <api:cashRegisterStatusQuery>
       <api:APNumberList>
-        <api:APNumber>{ap}</api:APNumber>
+        <api:APNumber>{escape(ap)}</api:APNumber>
       </api:APNumberList>
     </api:cashRegisterStatusQuery>""" if ap else ""
     body = f"""    <api:QueryCashRegisterStatusRequest>
 {header_block(rid, ts)}
-{user_block(rid, ts, use_exchange_key, debug)}
+{user_block(rid, ts, ts_sig, use_exchange_key, debug, cfg)}
 {software_block()}
 {ap_xml}
     </api:QueryCashRegisterStatusRequest>"""
     return envelope(body)
 
-def build_file_xml(ap: str, start: int, end: int | None, debug=False):
-    # requestId: max 30 karakter, pattern: [+a-zA-Z0-9_]{1,30}
-    rid = str(uuid.uuid4()).replace("-", "")[:30]  # UUID kötőjelek nélkül, max 30 kar
-    ts = now_utc_compact()
+def build_file_xml(ap: str, start: int, end: int | None, debug=False, cfg: NavConfig | None = None):
+    rid = new_request_id()
+    ts, ts_sig = now_utc_pair()
     end_xml = f"        <api:fileNumberEnd>{end}</api:fileNumberEnd>" if end else ""
     body = f"""    <api:QueryCashRegisterFileDataRequest>
 {header_block(rid, ts)}
-{user_block(rid, ts, False, debug)}
+{user_block(rid, ts, ts_sig, False, debug, cfg)}
 {software_block()}
       <api:cashRegisterFileDataQuery>
-        <api:APNumber>{ap}</api:APNumber>
+        <api:APNumber>{escape(ap)}</api:APNumber>
         <api:fileNumberStart>{start}</api:fileNumberStart>
 {end_xml}
       </api:cashRegisterFileDataQuery>
     </api:QueryCashRegisterFileDataRequest>"""
     return envelope(body)
 
-def post_xml(url: str, xml: str) -> requests.Response:
-    return requests.post(url, data=xml.encode("utf-8"), headers=make_headers(), timeout=120)
+# Egy közös session: a státusz- és fájllekérdezések ugyanazt a keep-alive TLS kapcsolatot használják
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+def post_xml(url: str, xml: str, stream: bool = False) -> requests.Response:
+    return _SESSION.post(url, data=xml.encode("utf-8"), headers=make_headers(), timeout=120, stream=stream)
+
+def parse_soap_fields(response_text: str) -> dict[str, str]:
+    """SOAP válasz elemeinek kigyűjtése egyetlen bejárással: {helyi név: szöveg} (első előfordulás)."""
+    try:
+        root = ET.fromstring(response_text)
+    except ET.ParseError:
+        return {}
+    fields: dict[str, str] = {}
+    for elem in root.iter():
+        name = elem.tag.rpartition('}')[2]
+        if name not in fields:
+            fields[name] = (elem.text or '').strip()
+    return fields
 
 def parse_status_response(response_text: str) -> dict | None:
     """Parse status response and extract min/max file numbers."""
-    func_code = re.search(r'<ns2:funcCode>(.*?)</ns2:funcCode>', response_text)
-    if not func_code or func_code.group(1) != "OK":
+    # Olcsó előszűrés: nem-OK válasznál az XML feldolgozás kihagyható (névtér-prefixtől független)
+    if 'funcCode>OK</' not in response_text:
+        return None
+    fields = parse_soap_fields(response_text)
+    if fields.get('funcCode') != "OK":
         return None
 
-    min_file = re.search(r'<ns3:minAvailableFileNumber>(.*?)</ns3:minAvailableFileNumber>', response_text)
-    max_file = re.search(r'<ns3:maxAvailableFileNumber>(.*?)</ns3:maxAvailableFileNumber>', response_text)
-    ap_num = re.search(r'<ns3:APNumber>(.*?)</ns3:APNumber>', response_text)
-
-    if min_file and max_file:
+    if fields.get('minAvailableFileNumber') and fields.get('maxAvailableFileNumber'):
         return {
-            'min': int(min_file.group(1)),
-            'max': int(max_file.group(1)),
-            'ap': ap_num.group(1) if ap_num else None
+            'min': int(fields['minAvailableFileNumber']),
+            'max': int(fields['maxAvailableFileNumber']),
+            'ap': fields.get('APNumber')
         }
     return None
 
 # ---- MTOM/multipart mentés (ZIP mellékletek) ----
+MTOM_CHUNK_SIZE = 1 << 20  # 1 MiB olvasási egység a multipart streameléshez
+
 def save_mtom_attachments(resp: requests.Response, out_dir: Path) -> list[Path]:
+    """ZIP mellékletek mentése a multipart válaszból, darabonként streamelve (a teljes válasz nincs a memóriában)."""
     out_dir.mkdir(parents=True, exist_ok=True)
     ctype = resp.headers.get("Content-Type", "")
+    chunks = resp.iter_content(chunk_size=MTOM_CHUNK_SIZE)
     if "multipart/related" not in ctype.lower():
-        (out_dir / "response.xml").write_bytes(resp.content)
+        with open(out_dir / "response.xml", "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
         return []
-    m = re.search(r'boundary="?([^";]+)"?', ctype, flags=re.I)
+    m = BOUNDARY_RE.search(ctype)
     if not m:
         raise RuntimeError("Nem találtam boundary-t a Content-Type fejlécben.")
-    boundary = m.group(1)
-    parts = resp.content.split(("--" + boundary).encode())
+    delim = ("--" + m.group(1)).encode()
+
+    buf = bytearray()
+    def fill() -> bool:
+        chunk = next(chunks, None)
+        if not chunk:
+            return False
+        buf.extend(chunk)
+        return True
+
+    # Preambulum átugrása az első határolóig
+    while (pos := buf.find(delim)) < 0:
+        if not fill():
+            return []
+    del buf[:pos + len(delim)]
+
     saved: list[Path] = []
     idx = 0
-    for part in parts:
-        part = part.strip()
-        if not part or part == b'--':
-            continue
-        header_end = part.find(b"\r\n\r\n")
-        if header_end < 0: header_end = part.find(b"\n\n")
-        if header_end < 0:  continue
-        header = part[:header_end].decode("utf-8", errors="ignore")
-        body   = part[header_end + (4 if part[header_end:header_end+4]==b'\r\n\r\n' else 2):]
-        if "application/octet-stream" in header.lower() or "application/zip" in header.lower():
+    while True:
+        # Záró határoló ("--boundary--") vagy a stream vége
+        while len(buf) < 2 and fill():
+            pass
+        if not buf or buf[:2] == b'--':
+            break
+
+        # Fejléc a part elején, üres sorig
+        while True:
+            crlf, lf = buf.find(b"\r\n\r\n"), buf.find(b"\n\n")
+            if crlf >= 0 and (lf < 0 or crlf < lf):
+                header_end, sep_len = crlf, 4
+                break
+            if lf >= 0:
+                header_end, sep_len = lf, 2
+                break
+            if not fill():
+                return saved
+        # A part fejléce ASCII: bytes regexek, csak a fájlnév kerül dekódolásra
+        header = bytes(buf[:header_end])
+        del buf[:header_end + sep_len]
+
+        out = None
+        if ZIP_CONTENT_TYPE_RE.search(header):
             name = None
-            m2 = re.search(r'name="?([^";]+)"?', header, flags=re.I)
-            if m2: name = m2.group(1)
+            m2 = PART_NAME_RE.search(header)
+            if m2: name = m2.group(1).decode("utf-8", errors="ignore")
             if not name: name = f"attachment_{idx}.zip"
             if not name.lower().endswith(".zip"): name += ".zip"
             out_file = out_dir / name
-            out_file.write_bytes(body)
+            out = open(out_file, "wb")
             saved.append(out_file); idx += 1
+
+        # Törzs streamelése a következő határolóig (a határoló előtti sortörés nem része)
+        try:
+            while True:
+                pos = buf.find(delim)
+                if pos >= 0:
+                    end = pos
+                    if buf[end - 2:end] == b"\r\n": end -= 2
+                    elif buf[end - 1:end] == b"\n": end -= 1
+                    if out: out.write(buf[:end])
+                    del buf[:pos + len(delim)]
+                    break
+                # A puffer vége egy félbevágott határolót is tartalmazhat
+                keep = len(delim) + 2
+                if len(buf) > keep:
+                    if out: out.write(buf[:-keep])
+                    del buf[:-keep]
+                if not fill():
+                    if out: out.write(buf)
+                    buf.clear()
+                    break
+        finally:
+            if out: out.close()
     return saved
 
-def unzip_all(zip_path: Path, dest_root: Path) -> list[Path]:
-    extracted: list[Path] = []
+UNZIP_WORKERS = os.cpu_count() or 4  # párhuzamos kibontás (a zlib elengedi a GIL-t)
+
+def _extract_members(zip_path: Path, dest_root: Path, members: list[zipfile.ZipInfo]) -> None:
+    # Saját ZipFile handle szálanként (egy handle nem szálbiztos)
+    with zipfile.ZipFile(zip_path, "r") as z:
+        for info in members:
+            z.extract(info, dest_root)
+
+def unzip_all(zip_path: Path, dest_root: Path, workers: int = UNZIP_WORKERS, suffix: str | None = None) -> list[Path]:
+    """ZIP kibontása; suffix megadásakor csak az így végződő tagok (pl. ".p7b") kerülnek kicsomagolásra."""
     with zipfile.ZipFile(zip_path, "r") as z:
-        z.extractall(dest_root)
-        for n in z.namelist():
-            extracted.append(dest_root / n)
-    return extracted
+        infos = z.infolist()
+        if suffix is not None:
+            infos = [i for i in infos if not i.is_dir() and i.filename.lower().endswith(suffix)]
+        names = [i.filename for i in infos]
+        if workers <= 1 or len(infos) < 2:
+            z.extractall(dest_root, members=infos)
+            return [dest_root / n for n in names]
+        # Könyvtárak előre, sorban létrehozva (a párhuzamos makedirs versenyhelyzet lenne)
+        files = []
+        for info in infos:
+            if info.is_dir():
+                z.extract(info, dest_root)
+            else:
+                (dest_root / info.filename).parent.mkdir(parents=True, exist_ok=True)
+                files.append(info)
+    # Fájlok szétosztása a szálak között, mindegyik saját handle-lel
+    workers = min(workers, len(files))
+    if workers:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            for fut in [ex.submit(_extract_members, zip_path, dest_root, files[i::workers]) for i in range(workers)]:
+                fut.result()
+    return [dest_root / n for n in names]
+
+def unzip_attachments(attachments: list[Path], out_dir: Path, suffix: str | None = None) -> list[list[Path]]:
+    """Több ZIP párhuzamos kibontása (ZIP-enként egy szál), a sorrend megmarad."""
+    if len(attachments) == 1:
+        # Egyetlen ZIP: a tagjai bomlanak ki párhuzamosan
+        z = attachments[0]
+        return [unzip_all(z, out_dir / (z.stem + "_unzipped"), suffix=suffix)]
+    with ThreadPoolExecutor(max_workers=UNZIP_WORKERS) as ex:
+        return list(ex.map(lambda z: unzip_all(z, out_dir / (z.stem + "_unzipped"), workers=1, suffix=suffix), attachments))
 
 # ---- P7B extraction (from extract_p7b.py) ----
+# CMS SignedData OID (1.2.840.113549.1.7.2) DER kódolva
+CMS_SIGNED_DATA_OID = bytes.fromhex("2a864886f70d010702")
+
+def _der_tlv(data: bytes, pos: int) -> tuple[int, int, int]:
+    """Egy DER TLV fejléc beolvasása: (tag, tartalom eleje, tartalom vége)."""
+    tag = data[pos]
+    length = data[pos + 1]
+    pos += 2
+    if length & 0x80:
+        n = length & 0x7f
+        if n == 0 or n > 4:  # indefinite hossz (BER) nem támogatott
+            raise ValueError("Nem támogatott DER hossz")
+        length = int.from_bytes(data[pos:pos + n], "big")
+        pos += n
+    if pos + length > len(data):
+        raise ValueError("Csonka DER elem")
+    return tag, pos, pos + length
+
+def _der_children(data: bytes, start: int, end: int) -> list[tuple[int, int, int]]:
+    children = []
+    while start < end:
+        child = _der_tlv(data, start)
+        children.append(child)
+        start = child[2]
+    return children
+
+def _der_octets(data: bytes, tag: int, start: int, end: int) -> bytes:
+    # Összetett (constructed) OCTET STRING esetén a darabok összefűzése
+    if tag & 0x20:
+        return b"".join(_der_octets(data, *c) for c in _der_children(data, start, end))
+    return data[start:end]
+
+def try_cms_content(p7b_path: Path) -> str | None:
+    """A CMS SignedData beágyazott tartalmának kinyerése folyamaton belül (nincs openssl subprocess)."""
+    try:
+        data = p7b_path.read_bytes()
+        tag, start, end = _der_tlv(data, 0)
+        if tag != 0x30:
+            return None
+        # ContentInfo ::= SEQUENCE { contentType OID, content [0] EXPLICIT SignedData }
+        content_info = _der_children(data, start, end)
+        (oid_tag, oid_start, oid_end), (_, sd_start, sd_end) = content_info[:2]
+        if oid_tag != 0x06 or data[oid_start:oid_end] != CMS_SIGNED_DATA_OID:
+            return None
+        # SignedData ::= SEQUENCE { version, digestAlgorithms, encapContentInfo, ... }
+        tag, start, end = _der_tlv(data, sd_start)
+        encap = _der_children(data, start, end)[2]
+        # EncapsulatedContentInfo ::= SEQUENCE { eContentType OID, eContent [0] EXPLICIT OCTET STRING }
+        econtent = _der_children(data, encap[1], encap[2])
+        if len(econtent) < 2 or econtent[1][0] != 0xa0:
+            return None
+        inner = _der_children(data, econtent[1][1], econtent[1][2])[0]
+        content = _der_octets(data, *inner)
+        if b'<?xml' in content:
+            return content.decode('utf-8')
+    except (OSError, ValueError, IndexError, UnicodeDecodeError):
+        pass
+    return None
+
 def try_openssl_cms(p7b_path: Path) -> str | None:
     """OpenSSL CMS parancs használata a tartalom kinyerésére."""
+    if OPENSSL_BIN is None:
+        return None
     try:
         result = subprocess.run(
-            ["openssl", "cms", "-in", str(p7b_path), "-inform", "DER", "-verify", "-noverify"],
+            [OPENSSL_BIN, "cms", "-in", str(p7b_path), "-inform", "DER", "-verify", "-noverify"],
             capture_output=True, text=False, timeout=10
         )
-        if result.returncode == 0 and result.stdout:
+        # Dekódolás csak akkor, ha a kimenetben tényleg van XML
+        if result.returncode == 0 and b'<?xml' in result.stdout:
             try:
-                decoded = result.stdout.decode('utf-8')
-                if '<?xml' in decoded:
-                    return decoded
+                return result.stdout.decode('utf-8')
             except UnicodeDecodeError:
                 pass
     except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.SubprocessError):
         pass
     return None
 
-def extract_xml_from_binary(p7b_path: Path) -> str | None:
-    """Regex-alapú XML kinyerés közvetlenül a bináris fájlból."""
-    try:
-        content = p7b_path.read_bytes()
-        content_str = content.decode('utf-8', errors='ignore')
-        # NAV OPG XML-ek <ROWS> root elemmel
+def _search_xml(content) -> str | None:
+    """XML keresése bytes-szerű tartalomban (bytes vagy mmap)."""
+    # NAV OPG XML-ek <ROWS> root elemmel: a határokat bytes.find keresi,
+    # a regex csak a kivágott szeleten validál
+    start = content.find(b'<?xml')
+    if start >= 0:
+        end = content.find(b'</ROWS>', start)
+        if end >= 0:
+            xml_match = XML_ROWS_RE.match(content, start, end + len(b'</ROWS>'))
+            if xml_match:
+                return xml_match.group(1).decode('utf-8', errors='ignore')
+    xml_match = XML_ROWS_RE.search(content)
+    if xml_match:
+        return xml_match.group(1).decode('utf-8', errors='ignore')
+    # Általánosabb pattern
+    root_search = XML_ROOT_TAG_RE.search(content)
+    if root_search:
+        root_tag = root_search.group(1)
         xml_match = re.search(
-            r'(<\?xml[^>]*\?>.*?<ROWS\b[^>]*>.*?</ROWS>)',
-            content_str, re.DOTALL | re.IGNORECASE
+            rb'(<\?xml[^>]*\?>.*?<' + root_tag + rb'\b[^>]*>.*?</' + root_tag + rb'>)',
+            content, re.DOTALL | re.IGNORECASE
         )
         if xml_match:
-            return xml_match.group(1)
-        # Általánosabb pattern
-        root_search = re.search(r'<\?xml[^>]*\?>\s*<([A-Z][A-Za-z0-9_]*)\b', content_str)
-        if root_search:
-            root_tag = root_search.group(1)
-            xml_match = re.search(
-                rf'(<\?xml[^>]*\?>.*?<{root_tag}\b[^>]*>.*?</{root_tag}>)',
-                content_str, re.DOTALL | re.IGNORECASE
-            )
-            if xml_match:
-                return xml_match.group(1)
+            return xml_match.group(1).decode('utf-8', errors='ignore')
+    return None
+
+def extract_xml_from_binary(p7b_path: Path) -> str | None:
+    """Regex-alapú XML kinyerés közvetlenül a bináris fájlból."""
+    try:
+        # A regex közvetlenül a memóriába leképezett fájlon fut (nincs teljes beolvasás/másolat),
+        # csak a találat kerül dekódolásra
+        with open(p7b_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            return _search_xml(content)
     except Exception:
         pass
     return None
@@ -251,13 +457,17 @@ def extract_p7b_to_xml(p7b_path: Path, output_path: Path | None = None, verbose:
     if not p7b_path.exists():
         return False
 
-    # OpenSSL próba
-    xml_content = try_openssl_cms(p7b_path)
-    method = "OpenSSL"
+    # Regex próba először (NAV OPG P7B-knél ez a működő út, nincs subprocess)
+    xml_content = extract_xml_from_binary(p7b_path)
+    method = "Regex"
+    if not xml_content:
+        # CMS tartalom kinyerése folyamaton belül
+        xml_content = try_cms_content(p7b_path)
+        method = "CMS"
     if not xml_content:
-        # Regex próba
-        xml_content = extract_xml_from_binary(p7b_path)
-        method = "Regex"
+        # OpenSSL próba (végső tartalék)
+        xml_content = try_openssl_cms(p7b_path)
+        method = "OpenSSL"
 
     if not xml_content:
         if verbose:
@@ -273,6 +483,32 @@ def extract_p7b_to_xml(p7b_path: Path, output_path: Path | None = None, verbose:
         print(f"  ✓ {p7b_path.name} → {output_path.name} ({method}, {size:,} bytes)")
     return True
 
+def extract_p7b_files(p7b_files: list[Path], verbose: bool = False) -> int:
+    """P7B fájlok kinyerése sorban; a sikeres kinyerések számát adja vissza."""
+    # Sorban: a regex/CMS út a GIL-t tartja, párhuzamosítás csak a ritka OpenSSL tartaléknál segítene
+    return sum(extract_p7b_to_xml(p, verbose=verbose) for p in p7b_files)
+
+# ---- Folyamaton belüli API (a sync szolgáltatás ezt hívja, nincs subprocess) ----
+def query_status(cfg: NavConfig, ap: str) -> dict | None:
+    """Státusz lekérdezés: {'min', 'max', 'ap'} vagy None, ha a lekérdezés sikertelen."""
+    r = post_xml(STATUS_URL, build_status_xml(ap, cfg=cfg))
+    if r.status_code != 200:
+        return None
+    return parse_status_response(r.text)
+
+def download_files(cfg: NavConfig, ap: str, start: int, end: int | None, out_dir: Path) -> list[Path]:
+    """Naplófájlok letöltése, P7B kibontás és XML kinyerés; a kinyert XML fájlok listája."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with post_xml(FILE_URL, build_file_xml(ap, start, end, cfg=cfg), stream=True) as r:
+        if r.status_code != 200:
+            raise RuntimeError(f"HTTP hiba: {r.status_code}")
+        attachments = save_mtom_attachments(r, out_dir)
+    if not attachments:
+        return []
+    p7b_files = [f for files in unzip_attachments(attachments, out_dir, suffix=".p7b") for f in files]
+    extract_p7b_files(p7b_files)
+    return [x for x in (p.with_suffix('.xml') for p in p7b_files) if x.exists()]
+
 def main():
     ap = argparse.ArgumentParser(description="NAV Online Pénztárgép (éles) – státusz és naplófájl letöltés")
     sub = ap.add_subparsers(dest="cmd", required=True)
@@ -301,7 +537,7 @@ def main():
         use_exchange = getattr(args, 'use_exchange_key', False)
         debug = getattr(args, 'debug', False)
         xml = build_status_xml(args.ap, use_exchange_key=use_exchange, debug=debug)
-        url = f"{BASE}/queryCashRegisterFile/v1/queryCashRegisterStatus"
+        url = STATUS_URL
 
         if debug:
             print("=== KÜLDÖTT XML ===")
@@ -317,33 +553,32 @@ def main():
             print(r.text)
         else:
             # Parse és print a lényeg
-            import re
             if r.status_code == 200 and "funcCode" in r.text:
-                func_code = re.search(r'<ns2:funcCode>(.*?)</ns2:funcCode>', r.text)
-                if func_code and func_code.group(1) == "OK":
+                fields = parse_soap_fields(r.text)
+                if fields.get('funcCode') == "OK":
                     print("✓ Státusz lekérdezés sikeres")
-                    ap_num = re.search(r'<ns3:APNumber>(.*?)</ns3:APNumber>', r.text)
-                    min_file = re.search(r'<ns3:minAvailableFileNumber>(.*?)</ns3:minAvailableFileNumber>', r.text)
-                    max_file = re.search(r'<ns3:maxAvailableFileNumber>(.*?)</ns3:maxAvailableFileNumber>', r.text)
-                    last_comm = re.search(r'<ns3:lastCommunicationDate>(.*?)</ns3:lastCommunicationDate>', r.text)
-                    last_file = re.search(r'<ns3:lastFileDate>(.*?)</ns3:lastFileDate>', r.text)
+                    ap_num = fields.get('APNumber')
+                    min_file = fields.get('minAvailableFileNumber')
+                    max_file = fields.get('maxAvailableFileNumber')
+                    last_comm = fields.get('lastCommunicationDate')
+                    last_file = fields.get('lastFileDate')
 
                     if ap_num:
-                        print(f"  AP szám: {ap_num.group(1)}")
+                        print(f"  AP szám: {ap_num}")
                     if last_comm:
-                        print(f"  Utolsó kommunikáció: {last_comm.group(1)}")
+                        print(f"  Utolsó kommunikáció: {last_comm}")
                     if last_file:
-                        print(f"  Utolsó fájl dátuma: {last_file.group(1)}")
+                        print(f"  Utolsó fájl dátuma: {last_file}")
                     if min_file and max_file:
-                        print(f"  Elérhető fájlok: {min_file.group(1)} - {max_file.group(1)} ({int(max_file.group(1)) - int(min_file.group(1)) + 1} db)")
+                        print(f"  Elérhető fájlok: {min_file} - {max_file} ({int(max_file) - int(min_file) + 1} db)")
                 else:
                     print("✗ Hiba:")
-                    error_code = re.search(r'<ns2:errorCode>(.*?)</ns2:errorCode>', r.text)
-                    message = re.search(r'<ns2:message>(.*?)</ns2:message>', r.text)
+                    error_code = fields.get('errorCode')
+                    message = fields.get('message')
                     if error_code:
-                        print(f"  Error code: {error_code.group(1)}")
+                        print(f"  Error code: {error_code}")
                     if message:
-                        print(f"  Message: {message.group(1)}")
+                        print(f"  Message: {message}")
             else:
                 print(f"✗ HTTP hiba: {r.status_code}")
                 print(r.text[:500])
@@ -353,14 +588,14 @@ def main():
         debug = getattr(args, 'debug', False)
         out_dir = Path(args.out); out_dir.mkdir(parents=True, exist_ok=True)
         xml = build_file_xml(args.ap, args.start, args.end, debug=debug)
-        url = f"{BASE}/queryCashRegisterFile/v1/queryCashRegisterFile"
+        url = FILE_URL
 
         if debug:
             print("=== KÜLDÖTT XML ===")
             print(xml)
             print(f"\n=== KÜLDÉS IDE: {url} ===")
 
-        r = post_xml(url, xml)
+        r = post_xml(url, xml, stream=True)
 
         if debug:
             print("HTTP:", r.status_code)
@@ -383,9 +618,7 @@ def main():
 
         # Kibontás
         p7b_files = []
-        for z in attachments:
-            target = out_dir / (z.stem + "_unzipped")
-            files = unzip_all(z, target)
+        for files in unzip_attachments(attachments, out_dir):
             for f in files:
                 if f.suffix.lower() == '.p7b':
                     p7b_files.append(f)
@@ -405,7 +638,7 @@ def main():
         # 1. Státusz lekérdezés
         print("📋 Státusz lekérdezése...")
         xml = build_status_xml(args.ap, use_exchange_key=use_exchange, debug=debug)
-        url = f"{BASE}/queryCashRegisterFile/v1/queryCashRegisterStatus"
+        url = STATUS_URL
         r = post_xml(url, xml)
 
         if r.status_code != 200:
@@ -424,8 +657,8 @@ def main():
         # 2. Fájlok letöltése
         print("\n📥 Fájlok letöltése...")
         xml = build_file_xml(args.ap, status['min'], status['max'], debug=debug)
-        url = f"{BASE}/queryCashRegisterFile/v1/queryCashRegisterFile"
-        r = post_xml(url, xml)
+        url = FILE_URL
+        r = post_xml(url, xml, stream=True)
 
         if r.status_code != 200:
             print(f"✗ HTTP hiba: {r.status_code}")
@@ -438,24 +671,15 @@ def main():
 
         print(f"✓ Letöltve {len(attachments)} ZIP fájl")
 
-        # 3. ZIP kibontás és P7B gyűjtés
+        # 3. ZIP kibontás: csak a P7B tagok kerülnek kicsomagolásra
         print("\n📦 ZIP fájlok kibontása...")
-        p7b_files = []
-        for z in attachments:
-            target = out_dir / (z.stem + "_unzipped")
-            files = unzip_all(z, target)
-            for f in files:
-                if f.suffix.lower() == '.p7b':
-                    p7b_files.append(f)
+        p7b_files = [f for files in unzip_attachments(attachments, out_dir, suffix=".p7b") for f in files]
 
         print(f"✓ Kibontva {len(p7b_files)} P7B fájl")
 
         # 4. XML kinyerés
         print("\n📄 XML kinyerés P7B fájlokból...")
-        success_count = 0
-        for p7b in p7b_files:
-            if extract_p7b_to_xml(p7b, verbose=debug):
-                success_count += 1
+        success_count = extract_p7b_files(p7b_files, verbose=debug)
 
         print(f"✓ Sikeresen kinyerve {success_count}/{len(p7b_files)} XML fájl")
         print(f"\n✅ Kész! Fájlok helye: {out_dir}/")
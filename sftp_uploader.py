@@ -6,16 +6,66 @@ Handles uploading XML files to FTP server with directory structure:
 """
 
 import os
+import logging
+import socket
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional, Tuple
 from datetime import datetime
-from ftplib import FTP
+from ftplib import FTP, error_perm, error_temp
+
+logger = logging.getLogger(__name__)
+
+# Number of parallel FTP connections used to upload one batch of files
+FTP_MAX_CONCURRENCY = int(os.getenv('FTP_MAX_CONCURRENCY', '4'))
+# Idle keep-alive uploaders kept per FTP account (concurrent uploads beyond this open fresh ones)
+FTP_POOL_SIZE = int(os.getenv('FTP_POOL_SIZE', '4'))
+# STOR block size; larger blocks mean fewer send() calls on the data connection (ftplib default 8192)
+FTP_BLOCK_SIZE = 64 * 1024
+# Use deflate transfer mode (MODE Z) when the server advertises it; XML compresses well
+FTP_MODE_Z = os.getenv('FTP_MODE_Z', '1') != '0'
+# Per-file retry delays (seconds) for transient errors; 5xx replies are not retried
+FTP_RETRY_DELAYS = (0.5, 1.0, 2.0)
+# Transient failures: 4xx replies, dropped or timed-out connections
+_TRANSIENT_ERRORS = (error_temp, EOFError, ConnectionError, TimeoutError)
+
+
+class _DeflateReader:
+    """File wrapper that yields a zlib stream, as expected on a MODE Z data connection."""
+
+    def __init__(self, fp):
+        self._fp = fp
+        self._compressor = zlib.compressobj(6)
+        self._done = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._done:
+            data = self._fp.read(size)
+            if not data:
+                self._done = True
+                return self._compressor.flush()
+            out = self._compressor.compress(data)
+            if out:
+                return out
+        return b''
+
+
+def _file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
 
 
 class FTPUploader:
     """FTP uploader for NAV OPG XML files."""
 
-    def __init__(self, host: str, username: str, password: str, port: int = 21, base_path: str = "users/opg_bizonylatok"):
+    def __init__(self, host: str, username: str, password: str, port: int = 21, base_path: str = "users/opg_bizonylatok",
+                 max_concurrency: int = FTP_MAX_CONCURRENCY, keep_alive: bool = False):
         """
         Initialize FTP uploader.
 
@@ -25,43 +75,117 @@ class FTPUploader:
             password: FTP password
             port: FTP port (default 21)
             base_path: Base directory on server (default "users/opg_bizonylatok")
+            max_concurrency: Parallel connections per upload batch (default FTP_MAX_CONCURRENCY)
+            keep_alive: Keep connections open between upload_xml_files calls (default False)
         """
         self.host = host
         self.username = username
         self.password = password
         self.port = port
         self.base_path = base_path.rstrip('/')
+        self.max_concurrency = max(1, max_concurrency)
+        self.keep_alive = keep_alive
         self.ftp = None
+        self._home_dir = None
+        self._idle: List[FTP] = []  # logged-in worker connections kept for reuse
+        self._lock = threading.Lock()  # one batch at a time per uploader
+        self._dir_cache: Dict[Tuple[str, str], str] = {}  # (login dir, target path) -> absolute target dir
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.disconnect()
+
+    def _open_connection(self) -> FTP:
+        """Open and log in a new FTP control connection."""
+        ftp = FTP()
+        ftp.connect(self.host, self.port, timeout=30)
+        # Control commands are small request/response pairs: don't let Nagle delay them.
+        # Keepalive lets the OS notice dead sessions on kept connections.
+        try:
+            ftp.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            ftp.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        except (AttributeError, OSError):
+            pass
+        ftp.login(self.username, self.password)
+        # Passive binary transfers for the whole session (no TYPE I before every STOR)
+        ftp.set_pasv(True)
+        ftp.voidcmd('TYPE I')
+        ftp.mode_z = False
+        if FTP_MODE_Z:
+            try:
+                if 'MODE Z' in ftp.sendcmd('FEAT').upper():
+                    ftp.voidcmd('MODE Z')
+                    ftp.mode_z = True
+            except Exception:
+                pass  # FEAT/MODE Z not supported: stay in stream mode
+        return ftp
+
+    @staticmethod
+    def _stor(ftp: FTP, filename: str, fp):
+        """STOR one file, deflating it on the fly when the connection is in MODE Z."""
+        # TYPE I is set once per session in _open_connection
+        with ftp.transfercmd(f'STOR {filename}') as conn:
+            if getattr(ftp, 'mode_z', False):
+                reader = _DeflateReader(fp)
+                while chunk := reader.read(FTP_BLOCK_SIZE):
+                    conn.sendall(chunk)
+            else:
+                # socket.sendfile copies page cache -> socket via os.sendfile
+                # where available (falls back to send() elsewhere)
+                conn.sendfile(fp)
+        ftp.voidresp()
+
+    @staticmethod
+    def _is_alive(ftp: FTP) -> bool:
+        """Check a kept connection with NOOP (servers drop idle sessions)."""
+        try:
+            ftp.voidcmd('NOOP')
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(ftp: FTP):
+        try:
+            ftp.quit()
+        except:
+            ftp.close()
 
     def connect(self) -> bool:
         """
-        Connect to FTP server.
+        Connect to FTP server, reusing the current connection if it is still alive.
 
         Returns:
             True if connected successfully, False otherwise
         """
+        if self.ftp is not None:
+            if self._is_alive(self.ftp):
+                return True
+            self._close(self.ftp)
+            self.ftp = None
+
         try:
-            self.ftp = FTP()
-            self.ftp.connect(self.host, self.port, timeout=30)
-            self.ftp.login(self.username, self.password)
+            self.ftp = self._open_connection()
 
             # Print current working directory for debugging
-            current_dir = self.ftp.pwd()
-            print(f"  FTP connected. Current directory: {current_dir}")
+            self._home_dir = self.ftp.pwd()
+            logger.info("FTP connected. Current directory: %s", self._home_dir)
 
             return True
 
         except Exception as e:
-            print(f"FTP connection failed: {e}")
+            logger.error("FTP connection failed: %s", e)
             return False
 
     def disconnect(self):
-        """Disconnect from FTP server."""
+        """Disconnect from FTP server, including kept worker connections."""
         if self.ftp:
-            try:
-                self.ftp.quit()
-            except:
-                self.ftp.close()
+            self._close(self.ftp)
+            self.ftp = None
+        while self._idle:
+            self._close(self._idle.pop())
 
     def _ensure_directory(self, remote_path: str) -> bool:
         """
@@ -74,58 +198,76 @@ class FTPUploader:
         Returns:
             True if directory exists or was created, False otherwise
         """
-        # Handle absolute paths
-        if remote_path.startswith('/'):
-            try:
-                # Try to navigate to absolute path
-                self.ftp.cwd(remote_path)
-                return True
-            except:
-                # Path doesn't exist, create it recursively
-                parts = [p for p in remote_path.split('/') if p]
-                self.ftp.cwd('/')  # Start from root
-
-                current_path = ''
-                for part in parts:
-                    current_path = f"{current_path}/{part}"
-                    try:
-                        self.ftp.cwd(part)
-                    except:
-                        try:
-                            self.ftp.mkd(part)
-                            self.ftp.cwd(part)
-                            print(f"  Created directory: {current_path}")
-                        except Exception as e:
-                            print(f"  Failed to create directory {current_path}: {e}")
-                            return False
-                return True
-
-        # Handle relative paths
         parts = [p for p in remote_path.split('/') if p]
-
         if not parts:
+            if remote_path.startswith('/'):
+                self.ftp.cwd('/')
             return True
 
-        # Navigate/create each directory level
-        current_path = ''
-        for part in parts:
-            current_path = f"{current_path}/{part}" if current_path else part
+        # Existing directory: a single CWD for the whole path
+        try:
+            self.ftp.cwd(remote_path)
+            return True
+        except error_perm:
+            pass
 
+        # Walk the path one level at a time, creating missing levels
+        if remote_path.startswith('/'):
+            self.ftp.cwd('/')  # Start from root
+            current_path = ''
+        else:
+            current_path = None
+        for part in parts:
+            current_path = f"{current_path}/{part}" if current_path is not None else part
             try:
-                # Try to change to directory
                 self.ftp.cwd(part)
-            except:
-                # Directory doesn't exist, create it
+            except error_perm:
                 try:
                     self.ftp.mkd(part)
+                    logger.info("Created directory: %s", current_path)
+                except error_perm as e:
+                    # 550 may just mean another connection created it meanwhile
+                    if not str(e).startswith('550'):
+                        logger.error("Failed to create directory %s: %s", current_path, e)
+                        return False
+                try:
                     self.ftp.cwd(part)
-                    print(f"  Created directory: {current_path}")
-                except Exception as e:
-                    print(f"  Failed to create directory {current_path}: {e}")
+                except error_perm as e:
+                    logger.error("Failed to create directory %s: %s", current_path, e)
                     return False
 
         return True
 
+    def _navigate_to(self, remote_path: str) -> Optional[str]:
+        """
+        Change into remote_path (relative to the login directory), creating it if needed.
+
+        Resolved directories are cached, so a known target costs a single CWD
+        instead of a walk over every path segment.
+
+        Args:
+            remote_path: Remote directory path (absolute or relative)
+
+        Returns:
+            Absolute remote directory, or None if it could not be created
+        """
+        cache_key = (self._home_dir, remote_path)
+        target_dir = self._dir_cache.get(cache_key)
+        if target_dir is not None:
+            try:
+                self.ftp.cwd(target_dir)
+                return target_dir
+            except Exception:
+                # Removed on the server since it was cached
+                self._dir_cache.pop(cache_key, None)
+
+        self.ftp.cwd(self._home_dir)
+        if not self._ensure_directory(remote_path):
+            return None
+        target_dir = self.ftp.pwd()
+        self._dir_cache[cache_key] = target_dir
+        return target_dir
+
     def upload_file(self, local_path: Path, remote_dir: str, filename: str) -> bool:
         """
         Upload single file to FTP server.
@@ -139,42 +281,128 @@ class FTPUploader:
             True if uploaded successfully, False otherwise
         """
         try:
-            # Navigate to base directory (absolute or relative)
-            if self.base_path.startswith('/'):
-                # Absolute path - navigate directly
-                try:
-                    self.ftp.cwd(self.base_path)
-                except:
-                    # Create base path if it doesn't exist
-                    print(f"  Base path {self.base_path} doesn't exist, creating...")
-                    if not self._ensure_directory(self.base_path):
-                        return False
-                    self.ftp.cwd(self.base_path)
-            else:
-                # Relative path - ensure it exists first
-                if not self._ensure_directory(self.base_path):
-                    return False
-
-            # Ensure target directory exists and navigate to it
-            if not self._ensure_directory(remote_dir):
+            # Ensure target directory (under base path) exists and navigate to it
+            if self._navigate_to(f"{self.base_path}/{remote_dir}") is None:
                 return False
 
             # Upload file in binary mode
             with open(local_path, 'rb') as f:
-                self.ftp.storbinary(f'STOR {filename}', f)
+                self._stor(self.ftp, filename, f)
 
             full_path = f"{self.base_path}/{remote_dir}/{filename}".replace('//', '/')
-            print(f"  Uploaded: {local_path.name} -> {full_path}")
+            logger.debug("Uploaded: %s -> %s", local_path.name, full_path)
             return True
 
         except Exception as e:
-            print(f"  Failed to upload {local_path.name}: {e}")
+            logger.warning("Failed to upload %s: %s", local_path.name, e)
             return False
 
+    def _reconnect(self, ftp: FTP, target_dir: str) -> FTP:
+        """
+        Replace a dropped connection with a new one positioned on target_dir.
+
+        Raises:
+            Exception: If the new connection cannot be opened or positioned
+                (a half-opened connection is closed first)
+        """
+        if self._is_alive(ftp):
+            return ftp
+        self._close(ftp)
+        new_ftp = self._open_connection()
+        try:
+            new_ftp.cwd(target_dir)
+        except Exception:
+            self._close(new_ftp)
+            raise
+        logger.info("FTP reconnected to %s", target_dir)
+        return new_ftp
+
+    def _store_files(self, ftp: FTP, target_dir: str, xml_files: List[Path]) -> Tuple[List[Tuple[str, bool]], FTP]:
+        """
+        Upload files into target_dir over the given connection.
+
+        Transient errors are retried per file with backoff (FTP_RETRY_DELAYS),
+        reconnecting if the server dropped the session; permanent (5xx)
+        errors fail the file immediately. If reconnecting fails, the current
+        and all remaining files are failed without further attempts.
+
+        Args:
+            ftp: Logged-in FTP connection
+            target_dir: Absolute remote directory (already created)
+            xml_files: Files to upload
+
+        Returns:
+            Tuple of ([(filename, uploaded), ...], connection in use afterwards)
+        """
+        outcomes = []
+        ftp.cwd(target_dir)
+        for index, xml_file in enumerate(xml_files):
+            uploaded = False
+            for attempt in range(len(FTP_RETRY_DELAYS) + 1):
+                try:
+                    with open(xml_file, 'rb') as f:
+                        self._stor(ftp, xml_file.name, f)
+                    logger.debug("Uploaded: %s", xml_file.name)
+                    uploaded = True
+                    break
+                except _TRANSIENT_ERRORS as e:
+                    if attempt == len(FTP_RETRY_DELAYS):
+                        logger.warning("Failed to upload %s: %s", xml_file.name, e)
+                        break
+                    delay = FTP_RETRY_DELAYS[attempt]
+                    logger.info("Transient error uploading %s (%s), retrying in %.1fs", xml_file.name, e, delay)
+                    time.sleep(delay)
+                    try:
+                        ftp = self._reconnect(ftp, target_dir)
+                    except Exception as reconnect_error:
+                        # No usable connection: fail this and the remaining files at once
+                        logger.error("FTP reconnect failed, %d files not uploaded: %s",
+                                     len(xml_files) - index, reconnect_error)
+                        outcomes += [(remaining.name, False) for remaining in xml_files[index:]]
+                        return outcomes, ftp
+                except Exception as e:
+                    logger.warning("Failed to upload %s: %s", xml_file.name, e)
+                    break
+            outcomes.append((xml_file.name, uploaded))
+        return outcomes, ftp
+
+    def _acquire_worker_connection(self) -> FTP:
+        """Take a live kept worker connection, or open a new one."""
+        while True:
+            try:
+                ftp = self._idle.pop()  # list.pop is atomic; workers share the idle list
+            except IndexError:
+                return self._open_connection()
+            if self._is_alive(ftp):
+                return ftp
+            self._close(ftp)
+
+    def _store_files_new_connection(self, target_dir: str, xml_files: List[Path]) -> List[Tuple[str, bool]]:
+        """Upload files over a dedicated connection (used by the parallel upload workers)."""
+        try:
+            ftp = self._acquire_worker_connection()
+        except Exception as e:
+            logger.error("FTP worker connection failed: %s", e)
+            return [(xml_file.name, False) for xml_file in xml_files]
+        try:
+            outcomes, ftp = self._store_files(ftp, target_dir, xml_files)
+        except Exception as e:
+            logger.error("FTP worker failed: %s", e)
+            self._close(ftp)
+            return [(xml_file.name, False) for xml_file in xml_files]
+        if self.keep_alive:
+            self._idle.append(ftp)
+        else:
+            self._close(ftp)
+        return outcomes
+
     def upload_xml_files(self, xml_files: List[Path], ap_number: str, year: int) -> Dict:
         """
         Upload multiple XML files to FTP server.
 
+        Files are spread over up to max_concurrency connections, so the
+        per-file STOR round trips overlap instead of running back to back.
+
         Directory structure: {base_path}/ap_number/year/
         Example: users/opg_bizonylatok/A29200455/2025/
 
@@ -202,64 +430,118 @@ class FTPUploader:
             result['success'] = True
             return result
 
+        with self._lock:
+            return self._upload_xml_files(xml_files, ap_number, year, result)
+
+    def _upload_xml_files(self, xml_files: List[Path], ap_number: str, year: int, result: Dict) -> Dict:
         # Connect to FTP
         if not self.connect():
             return result
 
         try:
-            # Save initial directory
-            initial_dir = self.ftp.pwd()
-            print(f"  Initial FTP directory: {initial_dir}")
+            # Paths resolve from the login directory (a kept connection may have moved away)
+            logger.debug("Initial FTP directory: %s", self._home_dir)
 
             # Build full target path
             full_target_path = f"{self.base_path}/{ap_number}/{year}"
-            print(f"  Target directory: {full_target_path}")
-
-            # Navigate to initial directory
-            self.ftp.cwd(initial_dir)
+            logger.debug("Target directory: %s", full_target_path)
 
             # Create and navigate to target directory ONCE
-            if not self._ensure_directory(full_target_path):
-                print(f"  Failed to create target directory: {full_target_path}")
+            target_dir = self._navigate_to(full_target_path)
+            if target_dir is None:
+                logger.error("Failed to create target directory: %s", full_target_path)
                 return result
-
-            # Save the target directory path
-            target_dir = self.ftp.pwd()
-            print(f"  Successfully navigated to: {target_dir}")
-
-            # Upload each file
-            for xml_file in xml_files:
-                try:
-                    # Navigate to target directory
-                    self.ftp.cwd(target_dir)
-
-                    # Upload file
-                    with open(xml_file, 'rb') as f:
-                        self.ftp.storbinary(f'STOR {xml_file.name}', f)
-
-                    print(f"  Uploaded: {xml_file.name}")
+            logger.debug("Successfully navigated to: %s", target_dir)
+
+            # Upload files: the first batch reuses this connection, the rest get their own
+            workers = min(self.max_concurrency, len(xml_files))
+            if workers > 1:
+                # Largest files first, dealt round-robin: connections finish at about the same time
+                xml_files = sorted(xml_files, key=_file_size, reverse=True)
+            batches = [xml_files[i::workers] for i in range(workers)]
+            if workers == 1:
+                outcomes, self.ftp = self._store_files(self.ftp, target_dir, xml_files)
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    primary = executor.submit(self._store_files, self.ftp, target_dir, batches[0])
+                    futures = [executor.submit(self._store_files_new_connection, target_dir, batch)
+                               for batch in batches[1:]]
+                    outcomes, self.ftp = primary.result()
+                    outcomes += [outcome for future in futures for outcome in future.result()]
+
+            for filename, uploaded in outcomes:
+                if uploaded:
                     result['uploaded'] += 1
-                    result['files'].append(xml_file.name)
-
-                except Exception as e:
-                    print(f"  Failed to upload {xml_file.name}: {e}")
+                    result['files'].append(filename)
+                else:
                     result['failed'] += 1
 
             result['success'] = result['failed'] == 0
+            logger.info("Uploaded %d/%d files to %s", result['uploaded'], len(xml_files), target_dir)
 
         finally:
-            self.disconnect()
+            if not self.keep_alive:
+                self.disconnect()
 
         return result
 
 
+# Idle keep-alive uploaders per account: (host, user, password, port, base_path) -> [FTPUploader]
+_idle_uploaders: Dict[Tuple, List[FTPUploader]] = {}
+_idle_uploaders_lock = threading.Lock()
+
+
+@contextmanager
+def checkout_ftp_uploader(host: str, username: str, password: str, port: int = 21,
+                          base_path: str = "users/opg_bizonylatok") -> Iterator[FTPUploader]:
+    """
+    Borrow a keep-alive uploader for one FTP account.
+
+    Each caller gets its own uploader (and so its own connections), so
+    concurrent user syncs upload in parallel. Returned uploaders keep their
+    connections open, checked with NOOP before reuse, so repeated syncs skip
+    the TCP connect and login; at most FTP_POOL_SIZE are kept per account.
+
+    Usage:
+        with checkout_ftp_uploader(host, user, password) as uploader:
+            uploader.upload_xml_files(...)
+
+    Args:
+        host: FTP server hostname
+        username: FTP username
+        password: FTP password
+        port: FTP port (default 21)
+        base_path: Base directory on server (default "users/opg_bizonylatok")
+
+    Yields:
+        FTPUploader with keep_alive enabled
+    """
+    key = (host, username, password, port, base_path)
+    with _idle_uploaders_lock:
+        idle = _idle_uploaders.setdefault(key, [])
+        uploader = idle.pop() if idle else None
+    if uploader is None:
+        uploader = FTPUploader(host=host, username=username, password=password, port=port,
+                               base_path=base_path, keep_alive=True)
+    try:
+        yield uploader
+    finally:
+        with _idle_uploaders_lock:
+            kept = len(idle) < FTP_POOL_SIZE
+            if kept:
+                idle.append(uploader)
+        if not kept:
+            uploader.disconnect()
+
+
 def upload_files_to_ftp(xml_files: List[Path], ap_number: str, year: int,
                         ftp_host: str, ftp_user: str, ftp_password: str,
                         ftp_port: int = 21, ftp_base_path: str = "users/opg_bizonylatok") -> Dict:
     """
     Upload XML files to FTP server.
 
-    Convenience function that creates uploader, uploads files, and returns results.
+    Convenience function that uploads files with a pooled uploader for
+    this account (see checkout_ftp_uploader) and returns results.
 
     Args:
         xml_files: List of XML file paths
@@ -274,21 +556,16 @@ def upload_files_to_ftp(xml_files: List[Path], ap_number: str, year: int,
     Returns:
         Dict with upload results
     """
-    uploader = FTPUploader(
-        host=ftp_host,
-        username=ftp_user,
-        password=ftp_password,
-        port=ftp_port,
-        base_path=ftp_base_path
-    )
-
-    return uploader.upload_xml_files(xml_files, ap_number, year)
+    with checkout_ftp_uploader(ftp_host, ftp_user, ftp_password, ftp_port, ftp_base_path) as uploader:
+        return uploader.upload_xml_files(xml_files, ap_number, year)
 
 
 if __name__ == "__main__":
     # Test FTP uploader
     import sys
 
+    logging.basicConfig(level=logging.INFO)
+
     if len(sys.argv) < 2:
         print("Usage: python3 sftp_uploader.py <xml_file_path>")
         sys.exit(1)
@@ -10,10 +10,14 @@ import re
 import xml.etree.ElementTree as ET
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import sqlite3
 import tempfile
 import shutil
+from contextlib import closing
 
 
 # Load .env file manually
@@ -31,15 +35,32 @@ def load_env():
 
 load_env()
 
-# Import NAV API functions from opg.py
+# NAV API client (status query, file download, P7B extraction)
 import opg
 from adalo_client import AdaloClient
 from sftp_uploader import upload_files_to_ftp
 
+# Number of users synced in parallel by sync_all_users
+SYNC_MAX_WORKERS = int(os.getenv('SYNC_MAX_WORKERS', '4'))
+
+# SQLite file with per-file aggregates of already processed NAV files (empty disables the cache)
+SYNC_CACHE_DB = os.getenv('SYNC_CACHE_DB', str(Path(tempfile.gettempdir()) / 'opg_sync_cache.sqlite3'))
+
+
+def _nav_config(credentials: Dict) -> opg.NavConfig:
+    """Build the opg.py NAV config for one user's credentials."""
+    return opg.NavConfig(
+        tech_login=credentials['navlogin'],
+        tech_password=credentials['navpassword'],
+        signing_key=credentials['signKey'],
+        exchange_key=credentials.get('exchangeKey') or '',
+        tax_number_8dig=credentials['taxNumber'][:8]
+    )
+
 
 def get_nav_status(ap_number: str, credentials: Dict) -> Optional[Dict]:
     """
-    Query NAV API for cash register status using opg.py CLI.
+    Query NAV API for cash register status via opg.py (in-process).
 
     Args:
         ap_number: AP number (e.g., A29200455)
@@ -48,86 +69,27 @@ def get_nav_status(ap_number: str, credentials: Dict) -> Optional[Dict]:
     Returns:
         Dict with 'min', 'max', 'ap' or None if error
     """
-    # WORKAROUND: Use opg.py CLI as subprocess since module import doesn't work
-    # We need to temporarily modify opg.py with user credentials
-
-    import subprocess
-
-    opg_path = Path(__file__).parent / 'opg.py'
-    backup_path = Path(__file__).parent / 'opg.py.backup'
-
     try:
-        # Backup original opg.py
-        opg_content = opg_path.read_text()
-        backup_path.write_text(opg_content)
-
-        # Modify opg.py with user credentials
-        modified = opg_content
-        modified = modified.replace(
-            f'TECH_LOGIN      = "{opg.TECH_LOGIN}"',
-            f'TECH_LOGIN      = "{credentials["navlogin"]}"'
-        )
-        modified = modified.replace(
-            f'TECH_PASSWORD   = "{opg.TECH_PASSWORD}"',
-            f'TECH_PASSWORD   = "{credentials["navpassword"]}"'
-        )
-        modified = modified.replace(
-            f'SIGNING_KEY     = "{opg.SIGNING_KEY}"',
-            f'SIGNING_KEY     = "{credentials["signKey"]}"'
-        )
-        modified = modified.replace(
-            f'TAX_NUMBER_8DIG = "{opg.TAX_NUMBER_8DIG}"',
-            f'TAX_NUMBER_8DIG = "{credentials["taxNumber"][:8]}"'
-        )
-        modified = modified.replace(
-            f'AP_NUMBER       = "{opg.AP_NUMBER}"',
-            f'AP_NUMBER       = "{ap_number}"'
-        )
-
-        opg_path.write_text(modified)
-
-        # Run opg.py status command
-        result = subprocess.run(
-            ['python3', str(opg_path), 'status', '--ap', ap_number],
-            capture_output=True, text=True, timeout=30
-        )
-
-        if result.returncode != 0:
-            print(f"    opg.py error: {result.stderr}")
-            return None
-
-        # Parse output
-        output = result.stdout
-        if 'Elérhető fájlok:' in output:
-            # Extract: "Elérhető fájlok: 1066 - 1089 (24 db)"
-            match = re.search(r'Elérhető fájlok:\s*(\d+)\s*-\s*(\d+)', output)
-            if match:
-                return {
-                    'min': int(match.group(1)),
-                    'max': int(match.group(2)),
-                    'ap': ap_number
-                }
-
-        print(f"    Failed to parse status output")
-        return None
-
-    except subprocess.TimeoutExpired:
-        print(f"    NAV API timeout")
-        return None
+        status = opg.query_status(_nav_config(credentials), ap_number)
     except Exception as e:
         print(f"    Exception: {e}")
         return None
-    finally:
-        # Restore original opg.py
-        if backup_path.exists():
-            opg_path.write_text(backup_path.read_text())
-            backup_path.unlink()
+
+    if not status:
+        print(f"    Failed to parse status response")
+        return None
+
+    return {
+        'min': status['min'],
+        'max': status['max'],
+        'ap': ap_number
+    }
 
 
 def download_nav_files(ap_number: str, start_file: int, end_file: int,
                        credentials: Dict, output_dir: Path) -> List[Path]:
     """
-    Download NAV log files using opg.py CLI (workaround for module import issues).
+    Download NAV log files via opg.py (in-process) and extract their XML.
 
     Args:
         ap_number: AP number
@@ -139,135 +101,108 @@ def download_nav_files(ap_number: str, start_file: int, end_file: int,
     Returns:
         List of extracted XML file paths
     """
-    import subprocess
-    import glob
+    xml_files = opg.download_files(_nav_config(credentials), ap_number, start_file, end_file, output_dir)
 
-    opg_path = Path(__file__).parent / 'opg.py'
-    backup_path = Path(__file__).parent / 'opg.py.backup'
+    # Log files are the A*.xml files directly inside an unzipped attachment directory
+    return [p for p in xml_files if p.parent.parent == output_dir and p.name.startswith('A')]
 
-    try:
-        # Backup and modify opg.py with user credentials
-        opg_content = opg_path.read_text()
-        backup_path.write_text(opg_content)
-
-        modified = opg_content
-        modified = modified.replace(
-            f'TECH_LOGIN      = "{opg.TECH_LOGIN}"',
-            f'TECH_LOGIN      = "{credentials["navlogin"]}"'
-        )
-        modified = modified.replace(
-            f'TECH_PASSWORD   = "{opg.TECH_PASSWORD}"',
-            f'TECH_PASSWORD   = "{credentials["navpassword"]}"'
-        )
-        modified = modified.replace(
-            f'SIGNING_KEY     = "{opg.SIGNING_KEY}"',
-            f'SIGNING_KEY     = "{credentials["signKey"]}"'
-        )
-        modified = modified.replace(
-            f'TAX_NUMBER_8DIG = "{opg.TAX_NUMBER_8DIG}"',
-            f'TAX_NUMBER_8DIG = "{credentials["taxNumber"][:8]}"'
-        )
 
-        opg_path.write_text(modified)
+# Log file names: A29200455_69785346_20251119174852_1079.xml
+_FILE_TIMESTAMP_RE = re.compile(r'_(\d{14})_(\d+)$')
 
-        # Run opg.py download-all command
-        output_dir.mkdir(parents=True, exist_ok=True)
 
-        result = subprocess.run(
-            ['python3', str(opg_path), 'download-all', '--ap', ap_number, '--out', str(output_dir)],
-            capture_output=True, text=True, timeout=180
-        )
+def _nyn_fields(nyn: ET.Element, tags: Tuple[str, str, str],
+                current_year: int) -> Optional[Tuple[str, int, bool]]:
+    """Read (date, amount, cancelled) from one NYN element, or None if it is incomplete or not in current_year."""
+    dts_tag, sum_tag, cnc_tag = tags
+
+    # DTS: receipt timestamp
+    dts_elem = nyn.find(dts_tag)
+    if dts_elem is None or not dts_elem.text:
+        return None
+
+    # Date is the YYYY-MM-DD prefix of the ISO timestamp (the UTC offset does not change it)
+    date_str = dts_elem.text[:10]
+    if date_str[:4] != str(current_year):
+        return None  # Skip if not current year
+    if date_str[4:5] != '-' or date_str[7:8] != '-' or not date_str[5:7].isdigit() or not date_str[8:].isdigit():
+        return None
 
-        if result.returncode != 0:
-            raise Exception(f"opg.py download-all failed: {result.stderr}")
+    # SUM: total amount (gross)
+    sum_elem = nyn.find(sum_tag)
+    if sum_elem is None or not sum_elem.text:
+        return None
 
-        # Find all extracted XML files
-        xml_files = []
-        for xml_path in output_dir.glob('*/A*.xml'):
-            xml_files.append(xml_path)
+    try:
+        amount = int(sum_elem.text)
+    except ValueError:
+        return None
 
-        return xml_files
+    # CNC: cancelled flag (1 = cancelled, 0 or missing = not cancelled)
+    cnc_elem = nyn.find(cnc_tag)
+    cancelled = cnc_elem is not None and cnc_elem.text == '1'
 
-    finally:
-        # Restore original opg.py
-        if backup_path.exists():
-            opg_path.write_text(backup_path.read_text())
-            backup_path.unlink()
+    return date_str, amount, cancelled
 
 
-def parse_xml_receipts(xml_path: Path, current_year: int) -> List[Dict]:
+def _iter_nyns(xml_path: Path) -> Iterator[Tuple[ET.Element, Tuple[str, str, str]]]:
     """
-    Parse XML file and extract receipt data.
+    Stream the NYN (receipt) elements of an XML file.
+
+    Each element is cleared once the caller moves on, so memory stays flat
+    regardless of the number of receipts.
 
     Args:
         xml_path: Path to XML file
-        current_year: Year to filter by (e.g., 2025)
-
-    Returns:
-        List of receipt dicts with: date, amount, cancelled, file_number
-    """
-    try:
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
 
-        # Extract file number from filename or LON element
-        file_number = None
-        filename = xml_path.stem
-        match = re.search(r'_(\d+)$', filename)
-        if match:
-            file_number = int(match.group(1))
-
-        # Parse namespace
-        ns = {}
-        if root.tag.startswith('{'):
-            ns_match = re.match(r'\{(.*?)\}', root.tag)
-            if ns_match:
-                ns['ns'] = ns_match.group(1)
-
-        # Find all NYN (receipt) elements
-        receipts = []
-        nyn_elements = root.findall('.//NYN') if not ns else root.findall('.//ns:NYN', ns)
-
-        for nyn in nyn_elements:
-            # DTS: receipt timestamp
-            dts_elem = nyn.find('DTS') if not ns else nyn.find('ns:DTS', ns)
-            if dts_elem is None or not dts_elem.text:
-                continue
+    Yields:
+        Tuple of (NYN element, its (DTS, SUM, CNC) child tags with namespace)
 
-            # Parse date
-            try:
-                receipt_dt = datetime.fromisoformat(dts_elem.text.replace('+01:00', '+00:00').replace('+02:00', '+00:00'))
-                if receipt_dt.year != current_year:
-                    continue  # Skip if not current year
-                date_str = receipt_dt.strftime('%Y-%m-%d')
-            except ValueError:
-                continue
+    Raises:
+        ET.ParseError: If the file is not well-formed XML
+    """
+    tags_by_nyn = {}  # NYN tag (with namespace) -> (DTS, SUM, CNC) tags
+    for _, elem in ET.iterparse(xml_path):
+        tag = elem.tag
+        if not tag.endswith('NYN'):
+            continue
+        child_tags = tags_by_nyn.get(tag)
+        if child_tags is None:
+            ns = tag[:-3]
+            if ns and not ns.endswith('}'):
+                continue  # e.g. <XNYN>, not a receipt
+            child_tags = tags_by_nyn[tag] = (f'{ns}DTS', f'{ns}SUM', f'{ns}CNC')
 
-            # SUM: total amount (gross)
-            sum_elem = nyn.find('SUM') if not ns else nyn.find('ns:SUM', ns)
-            if sum_elem is None or not sum_elem.text:
-                continue
+        yield elem, child_tags
+        elem.clear()
 
-            try:
-                amount = int(sum_elem.text)
-            except ValueError:
-                continue
 
-            # CNC: cancelled flag (1 = cancelled, 0 or missing = not cancelled)
-            cnc_elem = nyn.find('CNC') if not ns else nyn.find('ns:CNC', ns)
-            cancelled = cnc_elem is not None and cnc_elem.text == '1'
+def _count_receipts(xml_path: Path, current_year: int) -> Tuple[int, int]:
+    """
+    Count the non-cancelled receipts of one XML file and sum their amounts.
 
-            receipts.append({
-                'date': date_str,
-                'amount': amount,
-                'cancelled': cancelled,
-                'file_number': file_number
-            })
+    The totals are accumulated while streaming, without building receipt dicts.
 
-        return receipts
+    Args:
+        xml_path: Path to XML file
+        current_year: Year to filter by
 
+    Returns:
+        Tuple of (receipts_count, total_revenue); (0, 0) if the XML is malformed
+    """
+    receipts_count = 0
+    total_revenue = 0
+    try:
+        for nyn, tags in _iter_nyns(xml_path):
+            fields = _nyn_fields(nyn, tags, current_year)
+            # Skip incomplete and cancelled receipts
+            if fields is None or fields[2]:
+                continue
+            receipts_count += 1
+            total_revenue += fields[1]
     except ET.ParseError:
-        return []
+        return 0, 0
+    return receipts_count, total_revenue
 
 
 def aggregate_daily_revenues(xml_files: List[Path], current_year: int) -> Dict[str, Dict]:
@@ -290,12 +225,13 @@ def aggregate_daily_revenues(xml_files: List[Path], current_year: int) -> Dict[s
     """
     # Process each file individually
     file_data = {}
+    parse_paths = []
 
     for xml_path in xml_files:
         # Extract file number and date from filename
         # Format: A29200455_69785346_20251119174852_1079.xml
         filename = xml_path.stem
-        match = re.search(r'_(\d{14})_(\d+)$', filename)
+        match = _FILE_TIMESTAMP_RE.search(filename)
 
         if not match:
             print(f"    Warning: Cannot parse filename: {filename}")
@@ -319,20 +255,160 @@ def aggregate_daily_revenues(xml_files: List[Path], current_year: int) -> Dict[s
             'receipts_count': 0,
             'total_revenue': 0
         }
+        parse_paths.append((file_number, xml_path))
 
-        # Parse receipts from XML
-        receipts = parse_xml_receipts(xml_path, current_year)
+    # Parse receipts from XML (serially: ElementTree parsing holds the GIL, and this
+    # runs on web request threads where forking worker processes is unsafe)
+    for file_number, xml_path in parse_paths:
+        receipts_count, total_revenue = _count_receipts(xml_path, current_year)
+        file_data[file_number]['receipts_count'] = receipts_count
+        file_data[file_number]['total_revenue'] = total_revenue
 
-        for receipt in receipts:
-            # Skip cancelled receipts
-            if receipt['cancelled']:
-                continue
+    return file_data
 
-            # Only count receipts from current year
-            file_data[file_number]['receipts_count'] += 1
-            file_data[file_number]['total_revenue'] += receipt['amount']
 
-    return file_data
+def _open_sync_cache() -> sqlite3.Connection:
+    """Open the per-file aggregate cache, creating its table on first use."""
+    conn = sqlite3.connect(SYNC_CACHE_DB, timeout=30)
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS file_revenues ('
+        ' ap TEXT NOT NULL, year INTEGER NOT NULL, file_number INTEGER NOT NULL,'
+        ' date TEXT NOT NULL, receipts INTEGER NOT NULL, revenue INTEGER NOT NULL,'
+        ' PRIMARY KEY (ap, year, file_number))'
+    )
+    return conn
+
+
+def get_cached_file_revenues(ap_number: str, current_year: int,
+                             start_file: int, end_file: int) -> Dict[int, Dict]:
+    """
+    Look up per-file aggregates cached by earlier syncs.
+
+    Args:
+        ap_number: AP number
+        current_year: Year the aggregates were filtered by
+        start_file: First file number
+        end_file: Last file number
+
+    Returns:
+        Dict keyed by file number, same shape as aggregate_daily_revenues()
+    """
+    if not SYNC_CACHE_DB:
+        return {}
+    try:
+        with closing(_open_sync_cache()) as conn:
+            rows = conn.execute(
+                'SELECT file_number, date, receipts, revenue FROM file_revenues'
+                ' WHERE ap = ? AND year = ? AND file_number BETWEEN ? AND ?',
+                (ap_number, current_year, start_file, end_file)
+            ).fetchall()
+    except sqlite3.Error as e:
+        print(f"    Warning: sync cache unavailable: {e}")
+        return {}
+
+    return {
+        file_number: {
+            'file_number': file_number,
+            'date': date_str,
+            'receipts_count': receipts_count,
+            'total_revenue': total_revenue
+        }
+        for file_number, date_str, receipts_count, total_revenue in rows
+    }
+
+
+def cache_file_revenues(ap_number: str, current_year: int, file_revenues: Dict[int, Dict]):
+    """
+    Store per-file aggregates so later syncs skip downloading and parsing them.
+
+    Args:
+        ap_number: AP number
+        current_year: Year the aggregates were filtered by
+        file_revenues: Dict returned by aggregate_daily_revenues()
+    """
+    if not SYNC_CACHE_DB or not file_revenues:
+        return
+    try:
+        with closing(_open_sync_cache()) as conn, conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO file_revenues VALUES (?, ?, ?, ?, ?, ?)',
+                [(ap_number, current_year, file_number, data['date'],
+                  data['receipts_count'], data['total_revenue'])
+                 for file_number, data in file_revenues.items()]
+            )
+    except sqlite3.Error as e:
+        print(f"    Warning: sync cache not updated: {e}")
+
+
+@lru_cache(maxsize=1)
+def _ftp_config() -> Optional[Dict]:
+    """
+    Read the FTP settings from the environment once per process.
+
+    Returns:
+        upload_files_to_ftp() connection kwargs, or None if FTP is not configured
+    """
+    ftp_host = os.getenv('FTP_HOST')
+    ftp_user = os.getenv('FTP_USER')
+    ftp_password = os.getenv('FTP_PASSWORD')
+
+    if not all([ftp_host, ftp_user, ftp_password]):
+        return None
+
+    try:
+        ftp_port = int(os.getenv('FTP_PORT', '21'))
+    except ValueError:
+        print(f"  Warning: invalid FTP_PORT, FTP upload disabled")
+        return None
+
+    return {
+        'ftp_host': ftp_host,
+        'ftp_user': ftp_user,
+        'ftp_password': ftp_password,
+        'ftp_port': ftp_port,
+        'ftp_base_path': os.getenv('FTP_BASE_PATH', 'users/opg_bizonylatok')
+    }
+
+
+def upload_user_files(xml_files: List[Path], ap_number: str, current_year: int) -> Optional[Dict]:
+    """
+    Upload a user's XML files to FTP (optional, only if configured).
+
+    Args:
+        xml_files: XML file paths to upload
+        ap_number: AP number (target directory)
+        current_year: Year (target subdirectory)
+
+    Returns:
+        Upload result dict, or None if there was nothing to upload or FTP is not configured
+    """
+    if not xml_files:
+        return None
+
+    ftp_config = _ftp_config()
+    if ftp_config is None:
+        print(f"  FTP upload skipped (not configured)")
+        return None
+
+    print(f"  Uploading {len(xml_files)} XML files to FTP...")
+    try:
+        ftp_result = upload_files_to_ftp(
+            xml_files=xml_files,
+            ap_number=ap_number,
+            year=current_year,
+            **ftp_config
+        )
+
+        if ftp_result['success']:
+            print(f"  FTP upload successful: {ftp_result['uploaded']} files")
+        else:
+            print(f"  FTP upload partial: {ftp_result['uploaded']} succeeded, {ftp_result['failed']} failed")
+
+    except Exception as e:
+        print(f"  FTP upload error: {e}")
+        ftp_result = {'success': False, 'uploaded': 0, 'failed': len(xml_files), 'error': str(e)}
+
+    return ftp_result
 
 
 def sync_user(user: Dict, adalo_client: AdaloClient, current_year: int = None) -> Dict:
@@ -392,63 +468,50 @@ def sync_user(user: Dict, adalo_client: AdaloClient, current_year: int = None) -
         if start_file > end_file:
             return {'success': True, 'message': 'No new files to sync', 'files_synced': 0, 'revenues_created': 0}
 
+        # Files already processed by an earlier (e.g. partially completed) sync are not downloaded again
+        cached_revenues = get_cached_file_revenues(ap_number, current_year, start_file, end_file)
+        missing = [n for n in range(start_file, end_file + 1) if n not in cached_revenues]
+        if cached_revenues:
+            print(f"  Reusing {len(cached_revenues)} cached files")
+
         # Download files to temp directory
         with tempfile.TemporaryDirectory() as temp_dir:
             temp_path = Path(temp_dir)
-            xml_files = download_nav_files(ap_number, start_file, end_file, credentials, temp_path)
+            xml_files = []
+            if missing:
+                xml_files = download_nav_files(ap_number, missing[0], missing[-1], credentials, temp_path)
 
-            if not xml_files:
+            if not xml_files and not cached_revenues:
                 return {'success': True, 'message': 'No XML files extracted', 'files_synced': 0, 'revenues_created': 0}
 
-            # Aggregate daily revenues (now returns dict by file_number)
-            file_revenues = aggregate_daily_revenues(xml_files, current_year)
-
-            # Create Adalo records - one per file
-            revenues_created = 0
-            for file_number, data in sorted(file_revenues.items()):
-                adalo_client.create_daily_revenue(
-                    user_id=user_id,
-                    user_adoszama=credentials['taxNumber'],
-                    date=data['date'],
-                    file_number=file_number,
-                    receipts_count=data['receipts_count'],
-                    total_revenue=data['total_revenue']
-                )
-                revenues_created += 1
-
-            # Upload XML files to FTP (optional, only if configured)
-            ftp_result = None
-            ftp_host = os.getenv('FTP_HOST')
-            ftp_user = os.getenv('FTP_USER')
-            ftp_password = os.getenv('FTP_PASSWORD')
-
-            if all([ftp_host, ftp_user, ftp_password]):
-                print(f"  Uploading {len(xml_files)} XML files to FTP...")
-                try:
-                    ftp_port = int(os.getenv('FTP_PORT', '21'))
-                    ftp_base_path = os.getenv('FTP_BASE_PATH', 'users/opg_bizonylatok')
-
-                    ftp_result = upload_files_to_ftp(
-                        xml_files=xml_files,
-                        ap_number=ap_number,
-                        year=current_year,
-                        ftp_host=ftp_host,
-                        ftp_user=ftp_user,
-                        ftp_password=ftp_password,
-                        ftp_port=ftp_port,
-                        ftp_base_path=ftp_base_path
-                    )
-
-                    if ftp_result['success']:
-                        print(f"  FTP upload successful: {ftp_result['uploaded']} files")
-                    else:
-                        print(f"  FTP upload partial: {ftp_result['uploaded']} succeeded, {ftp_result['failed']} failed")
-
-                except Exception as e:
-                    print(f"  FTP upload error: {e}")
-                    ftp_result = {'success': False, 'uploaded': 0, 'failed': len(xml_files), 'error': str(e)}
-            else:
-                print(f"  FTP upload skipped (not configured)")
+            # Upload XML files to FTP in the background while they are parsed and posted to Adalo
+            with ThreadPoolExecutor(max_workers=1) as uploader:
+                ftp_upload = uploader.submit(upload_user_files, xml_files, ap_number, current_year)
+
+                # Aggregate daily revenues (now returns dict by file_number)
+                new_revenues = aggregate_daily_revenues(xml_files, current_year)
+                file_revenues = {**cached_revenues, **new_revenues}
+
+                # Create Adalo records - one per file, posted in parallel batches
+                revenues_created = 0
+                with adalo_client.begin_batch():
+                    for file_number, data in sorted(file_revenues.items()):
+                        adalo_client.create_daily_revenue(
+                            user_id=user_id,
+                            user_adoszama=credentials['taxNumber'],
+                            date=data['date'],
+                            file_number=file_number,
+                            receipts_count=data['receipts_count'],
+                            total_revenue=data['total_revenue']
+                        )
+                        revenues_created += 1
+
+                # Wait for the upload (the temp directory must outlive it)
+                ftp_result = ftp_upload.result()
+
+            # Remember processed files (only once they are safely on FTP, if configured)
+            if ftp_result is None or ftp_result['success']:
+                cache_file_revenues(ap_number, current_year, new_revenues)
 
             # Update user sync status
             now_iso = datetime.now(timezone.utc).isoformat()
@@ -480,14 +543,19 @@ def sync_user(user: Dict, adalo_client: AdaloClient, current_year: int = None) -
         return {'success': False, 'message': f'Error: {str(e)}', 'files_synced': 0, 'revenues_created': 0}
 
 
-def sync_all_users(adalo_client: AdaloClient, days_threshold: int = 10, current_year: int = None) -> Dict:
+def sync_all_users(adalo_client: AdaloClient, days_threshold: int = 10, current_year: int = None,
+                   max_workers: int = None) -> Dict:
     """
     Sync all users that need syncing (10+ days since last sync, not synced today).
 
+    Users are synced concurrently on a bounded thread pool; Adalo calls share
+    the client's rate limiter and NAV calls run in-process per user.
+
     Args:
         adalo_client: AdaloClient instance
         days_threshold: Number of days to trigger re-sync
         current_year: Year to filter by (defaults to current year)
+        max_workers: Parallel user syncs (defaults to SYNC_MAX_WORKERS)
 
     Returns:
         Dict with overall sync results including skipped count
@@ -495,12 +563,11 @@ def sync_all_users(adalo_client: AdaloClient, days_threshold: int = 10, current_
     if current_year is None:
         current_year = datetime.now().year
 
-    # Get all OPG-enabled users with credentials
-    all_users = adalo_client.get_all_users()
-    eligible_users = [u for u in all_users if u.get("onlinepenztargep") and all([
-        u.get("navlogin"), u.get("navpassword"), u.get("signKey"),
-        u.get("taxNumber"), u.get("apnumber")
-    ])]
+    # Get all OPG-enabled users with credentials (same query get_users_to_sync reuses from cache)
+    all_users = adalo_client.get_opg_users()
+    eligible_users = [u for u in all_users if u.get("onlinepenztargep") and all(
+        u.get(field) for field in AdaloClient.OPG_REQUIRED_FIELDS
+    )]
 
     users_to_sync = adalo_client.get_users_to_sync(days_threshold=days_threshold)
     skipped_count = len(eligible_users) - len(users_to_sync)
@@ -513,21 +580,27 @@ def sync_all_users(adalo_client: AdaloClient, days_threshold: int = 10, current_
         'user_results': []
     }
 
-    for user in users_to_sync:
+    def sync_one(user: Dict) -> Dict:
         print(f"Syncing user {user['id']} - {user.get('first_name')} ({user.get('Email')})...")
-        result = sync_user(user, adalo_client, current_year)
+        return sync_user(user, adalo_client, current_year)
 
-        if result['success']:
-            results['successful'] += 1
-        else:
-            results['failed'] += 1
-
-        results['user_results'].append({
-            'user_id': user['id'],
-            'user_name': user.get('first_name'),
-            'user_email': user.get('Email'),
-            **result
-        })
+    if max_workers is None:
+        max_workers = SYNC_MAX_WORKERS
+
+    # executor.map keeps results in the same order as users_to_sync
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for user, result in zip(users_to_sync, executor.map(sync_one, users_to_sync)):
+            if result['success']:
+                results['successful'] += 1
+            else:
+                results['failed'] += 1
+
+            results['user_results'].append({
+                'user_id': user['id'],
+                'user_name': user.get('first_name'),
+                'user_email': user.get('Email'),
+                **result
+            })
 
     return results
 
@@ -1,71 +1,358 @@
 import os
+import hmac
 import logging
-import traceback
-from datetime import datetime
-from flask import Flask, jsonify, request
-from functools import wraps
+import math
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import closing
+from datetime import datetime, timezone
+from flask import Flask, Response, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.middleware.proxy_fix import ProxyFix
+from functools import lru_cache, wraps
+from concurrent.futures import ThreadPoolExecutor
 
 from adalo_client import create_client_from_env
-from sync_service import sync_all_users, sync_user
+from sync_service import SYNC_MAX_WORKERS, sync_all_users, sync_user
 from online_invoice_api import handle_online_invoice_query
 from online_invoice_sync_service import sync_online_invoice_for_user
 
+try:
+    import orjson
+except ImportError:  # Optional: falls back to Flask's stdlib json provider
+    orjson = None
+
 
 # Configure logging
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# Trust only the X-Forwarded-For hops appended by our own proxies (Render adds one), so
+# request.remote_addr is the address that proxy saw, not a client-supplied header value
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.environ.get('WEB_PROXY_HOPS', '1')))
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (used by jsonify and request.get_json)."""
+
+    # Same output as the default provider: sorted keys, int keys allowed, and dates left
+    # to self.default so they keep Flask's RFC 822 format instead of orjson's ISO 8601
+    OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+               if orjson is not None else 0)
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default, option=self.OPTIONS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.OPTIONS),
+            mimetype=self.mimetype
+        )
+
+
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+
 # API Key for authentication
 API_KEY = os.environ.get("API_KEY", "")
+API_KEY_BYTES = API_KEY.encode('utf-8')
+
+# Maximum number of users accepted by one /api/sync/batch request
+MAX_SYNC_BATCH = 100
+
+# Upper bound for the max_workers a /api/sync/all caller may request
+MAX_SYNC_WORKERS = 16
+
+# Requests per minute per client IP on the sync endpoints (per worker process)
+SYNC_ALL_RATE_LIMIT = 5
+SYNC_USER_RATE_LIMIT = 30
+RATE_LIMIT_MAX_CLIENTS = 1024  # Tracked IPs before full buckets are dropped
+
+# SQLite file with background /api/sync/all task status (shared by all worker processes)
+SYNC_TASKS_DB = os.environ.get('SYNC_TASKS_DB', os.path.join(tempfile.gettempdir(), 'opg_sync_tasks.sqlite3'))
+# A "running" task older than this is treated as lost; keep it just above cron_sync's
+# CRON_MAX_WAIT so a task the cron gave up on does not block the next day's run
+SYNC_TASK_STALE_SECONDS = int(os.environ.get('SYNC_TASK_STALE_SECONDS', '7500'))
+SYNC_TASK_RETENTION_SECONDS = 7 * 86400  # Finished tasks are kept this long
+
+# Background sync_all runs one at a time per process (two would sync the same users twice)
+_sync_task_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def _json_body(payload: dict) -> bytes:
+    """Encode a JSON response body with the app's JSON provider (for bodies built once and reused)."""
+    return app.json.dumps(payload).encode('utf-8')
+
+
+def _json_response(body: bytes, status: int):
+    """Response for a precomputed JSON body."""
+    return app.response_class(body, mimetype='application/json'), status
+
+
+# Fixed error bodies, encoded once instead of per failing request
+_ERR_KEY_NOT_CONFIGURED = _json_body({'error': 'API key not configured'})
+_ERR_MISSING_AUTH = _json_body({'error': 'Missing Authorization header'})
+_ERR_AUTH_FORMAT = _json_body({'error': 'Invalid Authorization header format'})
+_ERR_INVALID_KEY = _json_body({'error': 'Invalid API key'})
+_ERR_NOT_FOUND = _json_body({'error': 'Not found', 'message': 'The requested endpoint does not exist'})
+
+
+@lru_cache(maxsize=1)
+def get_adalo_client():
+    """
+    Shared Adalo client for all requests.
+
+    Built on first use and reused, so its pooled HTTP session, rate limiter
+    and GET cache carry over between API calls.
+    """
+    return create_client_from_env()
 
 
 def require_api_key(f):
     """Decorator to require API key authentication."""
     @wraps(f)
     def decorated_function(*args, **kwargs):
+        # Never authenticate against an unset key
+        if not API_KEY_BYTES:
+            logger.error("API_KEY is not configured, rejecting request")
+            return _json_response(_ERR_KEY_NOT_CONFIGURED, 503)
+
         # Check Authorization header
         auth_header = request.headers.get('Authorization')
 
         if not auth_header:
-            return jsonify({'error': 'Missing Authorization header'}), 401
+            return _json_response(_ERR_MISSING_AUTH, 401)
 
-        # Expected format: "Bearer {api_key}"
-        parts = auth_header.split()
-        if len(parts) != 2 or parts[0].lower() != 'bearer':
-            return jsonify({'error': 'Invalid Authorization header format'}), 401
+        # Expected format: "Bearer {api_key}" (scheme is case-insensitive)
+        if auth_header[:7].lower() != 'bearer ':
+            return _json_response(_ERR_AUTH_FORMAT, 401)
 
-        provided_key = parts[1]
+        provided_key = auth_header[7:].strip()
+        if not provided_key:
+            return _json_response(_ERR_AUTH_FORMAT, 401)
 
-        if provided_key != API_KEY:
-            return jsonify({'error': 'Invalid API key'}), 403
+        if not hmac.compare_digest(provided_key.encode('utf-8'), API_KEY_BYTES):
+            return _json_response(_ERR_INVALID_KEY, 403)
 
         return f(*args, **kwargs)
 
     return decorated_function
 
 
+def rate_limit(per_minute: int):
+    """
+    Decorator to throttle an endpoint per client IP with a token bucket.
+
+    Each client may burst up to per_minute requests; tokens refill
+    continuously. Excess requests get 429 with a Retry-After header, so a
+    retry storm cannot fan out to Adalo and NAV. Buckets live in this
+    worker process.
+    """
+    refill_per_second = per_minute / 60.0
+    buckets = {}  # client IP -> (tokens, monotonic time of last update)
+    lock = threading.Lock()
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            client = request.remote_addr
+            now = time.monotonic()
+            with lock:
+                tokens, last = buckets.get(client, (per_minute, now))
+                tokens = min(per_minute, tokens + (now - last) * refill_per_second)
+                if tokens < 1:
+                    buckets[client] = (tokens, now)
+                    retry_after = math.ceil((1 - tokens) / refill_per_second)
+                    logger.warning("Rate limit exceeded for %s on %s", client, request.path)
+                    response = jsonify({'error': 'Too many requests', 'retry_after': retry_after})
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response, 429
+                buckets[client] = (tokens - 1, now)
+
+                if len(buckets) > RATE_LIMIT_MAX_CLIENTS:
+                    # Forget clients whose bucket has refilled (they are back to the default)
+                    for key in [k for k, (t, ts) in buckets.items()
+                                if t + (now - ts) * refill_per_second >= per_minute]:
+                        del buckets[key]
+
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
+
+
+# /health response body cache: (unix second, encoded JSON)
+_health_body = (0, b'')
+
+
+def _open_tasks_db() -> sqlite3.Connection:
+    """Open the background task table, creating it on first use."""
+    conn = sqlite3.connect(SYNC_TASKS_DB, timeout=30, isolation_level=None)
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS sync_tasks ('
+        ' task_id TEXT PRIMARY KEY, status TEXT NOT NULL, owner TEXT,'
+        ' started_at REAL NOT NULL, finished_at REAL, result TEXT)'
+    )
+    return conn
+
+
+def _task_owner() -> str:
+    """Identify the worker process running a task as "host:pid"."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _task_lost(started_at: float, owner) -> bool:
+    """
+    Whether a "running" task can no longer finish.
+
+    A task is lost once it is older than SYNC_TASK_STALE_SECONDS, or when
+    the worker process that owns it (on this host) no longer exists.
+    """
+    if started_at < time.time() - SYNC_TASK_STALE_SECONDS:
+        return True
+    host, _, pid = (owner or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass  # Exists, owned by another user
+    return False
+
+
+def _start_sync_task():
+    """
+    Register a new background sync_all task unless one is already running.
+
+    Running tasks that are lost (see _task_lost) are marked "lost" first,
+    so a crashed worker does not block new syncs.
+
+    Returns:
+        Tuple of (task_id, created); created is False if a running task was found
+    """
+    now = time.time()
+    with closing(_open_tasks_db()) as conn:
+        # IMMEDIATE: check-and-insert is atomic across worker processes
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM sync_tasks WHERE finished_at < ?', (now - SYNC_TASK_RETENTION_SECONDS,))
+            rows = conn.execute(
+                "SELECT task_id, started_at, owner FROM sync_tasks WHERE status = 'running'"
+            ).fetchall()
+            for running_id, started_at, owner in rows:
+                if not _task_lost(started_at, owner):
+                    conn.execute('COMMIT')
+                    return running_id, False
+                conn.execute(
+                    "UPDATE sync_tasks SET status = 'lost', finished_at = ? WHERE task_id = ?",
+                    (now, running_id)
+                )
+            task_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO sync_tasks (task_id, status, owner, started_at) VALUES (?, 'running', ?, ?)",
+                (task_id, _task_owner(), now)
+            )
+            conn.execute('COMMIT')
+            return task_id, True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+
+def _finish_sync_task(task_id: str, status: str, result: dict):
+    """Store the final status and result of a background task."""
+    with closing(_open_tasks_db()) as conn:
+        conn.execute(
+            'UPDATE sync_tasks SET status = ?, finished_at = ?, result = ? WHERE task_id = ?',
+            (status, time.time(), app.json.dumps(result), task_id)
+        )
+
+
+def _run_sync_task(task_id: str, days_threshold: int, current_year: int, max_workers):
+    """Run sync_all_users for a background task and record its outcome."""
+    try:
+        results = sync_all_users(get_adalo_client(), days_threshold=days_threshold,
+                                 current_year=current_year, max_workers=max_workers)
+        logger.info("Background sync %s completed: %s", task_id, results)
+        _finish_sync_task(task_id, 'done', {'success': True, **results})
+    except Exception as e:
+        logger.exception("=== BACKGROUND SYNC %s ERROR === %s", task_id, e)
+        _finish_sync_task(task_id, 'failed', {'success': False, 'error': str(e)})
+
+
+def _iso(timestamp):
+    """ISO 8601 UTC string for a unix timestamp (None stays None)."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat() if timestamp is not None else None
+
+
+def json_errors(f):
+    """
+    Decorator turning an unhandled handler exception into a logged 500 JSON error.
+
+    Returns {'success': False, 'error': ..., 'timestamp': ...} with status 500.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        try:
+            return f(*args, **kwargs)
+        except Exception as e:
+            # e.g. "=== SYNC_SINGLE_USER 146 ERROR === ..."
+            label = ' '.join([f.__name__.upper(), *map(str, kwargs.values())])
+            logger.exception("=== %s ERROR === %s", label, e)
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }), 500
+
+    return decorated_function
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """
     Health check endpoint.
 
+    The body only changes once per second (second-precision timestamp), so
+    it is built once per second and reused for frequent probes.
+
     Returns:
         200 OK with status info
     """
-    return jsonify({
-        'status': 'healthy',
-        'service': 'opg-sync-service',
-        'timestamp': datetime.now().isoformat()
-    }), 200
+    global _health_body
+    second = int(time.time())
+    cached = _health_body
+    if cached[0] != second:
+        body = _json_body({
+            'status': 'healthy',
+            'service': 'opg-sync-service',
+            'timestamp': datetime.fromtimestamp(second).isoformat()
+        })
+        # Single tuple swap: concurrent readers see either the old or the new body
+        cached = _health_body = (second, body)
+    return _json_response(cached[1], 200)
 
 
 @app.route('/api/sync/all', methods=['POST'])
 @require_api_key
+@rate_limit(SYNC_ALL_RATE_LIMIT)
+@json_errors
 def sync_all():
     """
     Sync all users that need syncing (10+ days since last sync).
@@ -78,53 +365,124 @@ def sync_all():
     Request body (optional JSON):
         {
             "days_threshold": 10,  # Optional, defaults to 10
-            "current_year": 2025    # Optional, defaults to current year
+            "current_year": 2025,   # Optional, defaults to current year
+            "max_workers": 4,       # Optional, parallel user syncs (1-MAX_SYNC_WORKERS, defaults to SYNC_MAX_WORKERS)
+            "background": true      # Optional, return 202 at once and run the sync in the background
         }
 
     Returns:
         200 OK with sync results
+        202 Accepted with task_id (background); poll /api/sync/tasks/<task_id>.
+            If a sync is already running, its task_id is returned instead.
+        409 Conflict with the running task_id if a sync is already running (foreground)
         500 Error if sync fails
     """
-    try:
-        logger.info("=== SYNC ALL REQUEST STARTED ===")
+    logger.info("=== SYNC ALL REQUEST STARTED ===")
 
-        # Parse request body (silent=True to handle empty body)
-        data = request.get_json(silent=True) or {}
-        days_threshold = data.get('days_threshold', 10)
-        current_year = data.get('current_year', datetime.now().year)
+    # Parse request body (silent=True to handle empty body)
+    data = request.get_json(silent=True) or {}
+    days_threshold = data.get('days_threshold', 10)
+    current_year = data.get('current_year', datetime.now().year)
+    max_workers = data.get('max_workers')  # None: sync_all_users uses SYNC_MAX_WORKERS
 
-        logger.info(f"Request params: days_threshold={days_threshold}, current_year={current_year}")
+    if max_workers is not None and (not isinstance(max_workers, int) or isinstance(max_workers, bool)
+                                    or not 1 <= max_workers <= MAX_SYNC_WORKERS):
+        return jsonify({
+            'success': False,
+            'error': f'max_workers must be an integer between 1 and {MAX_SYNC_WORKERS}',
+            'timestamp': datetime.now().isoformat()
+        }), 400
 
-        # Create Adalo client
-        logger.info("Creating Adalo client from environment...")
-        adalo_client = create_client_from_env()
-        logger.info("Adalo client created successfully")
+    logger.info("Request params: days_threshold=%s, current_year=%s, max_workers=%s",
+                days_threshold, current_year, max_workers)
 
-        # Run sync
-        logger.info("Starting sync_all_users...")
-        results = sync_all_users(adalo_client, days_threshold=days_threshold, current_year=current_year)
-        logger.info(f"Sync completed successfully: {results}")
+    # Foreground and background runs share the task table, so only one sync_all runs at a time
+    task_id, created = _start_sync_task()
 
+    if data.get('background'):
+        if created:
+            _sync_task_executor.submit(_run_sync_task, task_id, days_threshold, current_year, max_workers)
+            logger.info("Background sync %s started", task_id)
+        else:
+            logger.info("Background sync %s already running", task_id)
         return jsonify({
             'success': True,
             'timestamp': datetime.now().isoformat(),
-            **results
-        }), 200
-
-    except Exception as e:
-        logger.error(f"=== SYNC ALL ERROR ===")
-        logger.error(f"Error: {str(e)}")
-        logger.error(f"Traceback:\n{traceback.format_exc()}")
+            'task_id': task_id,
+            'already_running': not created,
+            'status_url': f'/api/sync/tasks/{task_id}'
+        }), 202
 
+    if not created:
+        logger.info("Sync %s already running, refusing foreground sync", task_id)
         return jsonify({
             'success': False,
-            'error': str(e),
-            'timestamp': datetime.now().isoformat()
-        }), 500
+            'error': 'A sync is already running',
+            'timestamp': datetime.now().isoformat(),
+            'task_id': task_id,
+            'status_url': f'/api/sync/tasks/{task_id}'
+        }), 409
+
+    adalo_client = get_adalo_client()
+
+    # Run sync
+    logger.info("Starting sync_all_users (task %s)...", task_id)
+    try:
+        results = sync_all_users(adalo_client, days_threshold=days_threshold, current_year=current_year,
+                                 max_workers=max_workers)
+    except Exception as e:
+        _finish_sync_task(task_id, 'failed', {'success': False, 'error': str(e)})
+        raise
+    _finish_sync_task(task_id, 'done', {'success': True, **results})
+    logger.info("Sync completed successfully: %s", results)
+
+    return jsonify({
+        'success': True,
+        'timestamp': datetime.now().isoformat(),
+        **results
+    }), 200
+
+
+@app.route('/api/sync/tasks/<task_id>', methods=['GET'])
+@require_api_key
+@json_errors
+def sync_task_status(task_id: str):
+    """
+    Status of a background /api/sync/all task.
+
+    Headers:
+        Authorization: Bearer {api_key}
+
+    Returns:
+        200 OK with {'task_id', 'status' (running/done/failed/lost), 'started_at',
+        'finished_at'} plus the sync results once finished; "lost" means the
+        worker running it died or it outlived SYNC_TASK_STALE_SECONDS
+        404 Not Found if the task is unknown or expired
+    """
+    with closing(_open_tasks_db()) as conn:
+        row = conn.execute(
+            'SELECT status, owner, started_at, finished_at, result FROM sync_tasks WHERE task_id = ?',
+            (task_id,)
+        ).fetchone()
+    if row is None:
+        return jsonify({'success': False, 'error': 'Unknown task'}), 404
+
+    status, owner, started_at, finished_at, result = row
+    if status == 'running' and _task_lost(started_at, owner):
+        status = 'lost'
+    return jsonify({
+        **(app.json.loads(result) if result else {}),
+        'task_id': task_id,
+        'status': status,
+        'started_at': _iso(started_at),
+        'finished_at': _iso(finished_at)
+    }), 200
 
 
 @app.route('/api/sync/<int:user_id>', methods=['POST'])
 @require_api_key
+@rate_limit(SYNC_USER_RATE_LIMIT)
+@json_errors
 def sync_single_user(user_id: int):
     """
     Manually sync a specific user.
@@ -147,108 +505,188 @@ def sync_single_user(user_id: int):
         404 Not Found if user doesn't exist
         500 Error if sync fails
     """
+    logger.info("=== SYNC USER %s REQUEST STARTED ===", user_id)
+
+    # Parse request body (silent=True to handle empty body)
+    data = request.get_json(silent=True) or {}
+    current_year = data.get('current_year', datetime.now().year)
+
+    logger.info("Request params: user_id=%s, current_year=%s", user_id, current_year)
+
+    adalo_client = get_adalo_client()
+
+    # Get user
     try:
-        logger.info(f"=== SYNC USER {user_id} REQUEST STARTED ===")
+        logger.info("Fetching user %s from Adalo...", user_id)
+        user = adalo_client.get_user_by_id(user_id)
+        logger.info("User fetched: %s (%s)", user.get('first_name'), user.get('Email'))
+        logger.debug(
+            "User credentials present: navlogin=%s, navpassword=%s, signKey=%s, taxNumber=%s, apnumber=%s",
+            bool(user.get('navlogin')), bool(user.get('navpassword')), bool(user.get('signKey')),
+            bool(user.get('taxNumber')), user.get('apnumber')
+        )
+    except Exception as e:
+        logger.exception("Failed to fetch user %s: %s", user_id, e)
+        return jsonify({
+            'success': False,
+            'error': f'User not found: {str(e)}',
+            'timestamp': datetime.now().isoformat()
+        }), 404
 
-        # Parse request body (silent=True to handle empty body)
-        data = request.get_json(silent=True) or {}
-        current_year = data.get('current_year', datetime.now().year)
+    # Run sync
+    logger.info("Starting sync for user %s...", user_id)
+    result = sync_user(user, adalo_client, current_year=current_year)
+    logger.info("Sync result: %s", result)
 
-        logger.info(f"Request params: user_id={user_id}, current_year={current_year}")
+    status_code = 200 if result['success'] else 500
 
-        # Create Adalo client
-        logger.info("Creating Adalo client from environment...")
-        adalo_client = create_client_from_env()
-        logger.info("Adalo client created successfully")
+    return jsonify({
+        'timestamp': datetime.now().isoformat(),
+        'user_id': user_id,
+        'user_name': user.get('first_name'),
+        'user_email': user.get('Email'),
+        **result
+    }), status_code
 
-        # Get user
-        try:
-            logger.info(f"Fetching user {user_id} from Adalo...")
-            user = adalo_client.get_user_by_id(user_id)
-            logger.info(f"User fetched: {user.get('first_name')} ({user.get('Email')})")
-            logger.info(f"User credentials present: navlogin={bool(user.get('navlogin'))}, navpassword={bool(user.get('navpassword'))}, signKey={bool(user.get('signKey'))}, taxNumber={bool(user.get('taxNumber'))}, apnumber={user.get('apnumber')}")
-        except Exception as e:
-            logger.error(f"Failed to fetch user {user_id}: {str(e)}")
-            logger.error(f"Traceback:\n{traceback.format_exc()}")
-            return jsonify({
-                'success': False,
-                'error': f'User not found: {str(e)}',
-                'timestamp': datetime.now().isoformat()
-            }), 404
 
-        # Run sync
-        logger.info(f"Starting sync for user {user_id}...")
-        result = sync_user(user, adalo_client, current_year=current_year)
-        logger.info(f"Sync result: {result}")
+@app.route('/api/sync/batch', methods=['POST'])
+@require_api_key
+@rate_limit(SYNC_ALL_RATE_LIMIT)
+@json_errors
+def sync_batch():
+    """
+    Manually sync several users in one request.
 
-        status_code = 200 if result['success'] else 500
+    Users are synced concurrently (SYNC_MAX_WORKERS at a time). Each user
+    gets its own result, so one failure does not fail the whole batch.
 
-        return jsonify({
-            'timestamp': datetime.now().isoformat(),
+    Headers:
+        Authorization: Bearer {api_key}
+
+    Request body (JSON):
+        {
+            "user_ids": [146, 147],  # Required, at most MAX_SYNC_BATCH ids
+            "current_year": 2025     # Optional, defaults to current year
+        }
+
+    Returns:
+        200 OK with per-user results
+        400 Bad Request if user_ids is missing, invalid or too long
+        500 Error on an unexpected failure
+    """
+    data = request.get_json(silent=True) or {}
+    user_ids = data.get('user_ids')
+    current_year = data.get('current_year', datetime.now().year)
+
+    if not isinstance(user_ids, list) or not user_ids or not all(
+            isinstance(user_id, int) and not isinstance(user_id, bool) for user_id in user_ids):
+        return jsonify({'success': False, 'error': 'user_ids must be a non-empty list of integers'}), 400
+    if len(user_ids) > MAX_SYNC_BATCH:
+        return jsonify({'success': False, 'error': f'At most {MAX_SYNC_BATCH} user_ids per batch'}), 400
+    # The same user must not be synced twice at once (duplicate revenue records)
+    user_ids = list(dict.fromkeys(user_ids))
+
+    logger.info("=== SYNC BATCH REQUEST STARTED === users=%d, current_year=%s", len(user_ids), current_year)
+    adalo_client = get_adalo_client()
+
+    def sync_one(user_id: int) -> dict:
+        try:
+            user = adalo_client.get_user_by_id(user_id)
+        except Exception as e:
+            logger.error("Failed to fetch user %s: %s", user_id, e)
+            return {'user_id': user_id, 'success': False, 'error': f'User not found: {str(e)}'}
+        try:
+            result = sync_user(user, adalo_client, current_year=current_year)
+        except Exception as e:
+            logger.error("Sync failed for user %s: %s", user_id, e)
+            result = {'success': False, 'error': str(e)}
+        return {
             'user_id': user_id,
             'user_name': user.get('first_name'),
             'user_email': user.get('Email'),
             **result
-        }), status_code
+        }
 
-    except Exception as e:
-        logger.error(f"=== SYNC USER {user_id} ERROR ===")
-        logger.error(f"Error: {str(e)}")
-        logger.error(f"Traceback:\n{traceback.format_exc()}")
+    with ThreadPoolExecutor(max_workers=max(1, min(SYNC_MAX_WORKERS, len(user_ids)))) as executor:
+        results = list(executor.map(sync_one, user_ids))
 
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'timestamp': datetime.now().isoformat()
-        }), 500
+    successful = sum(1 for result in results if result['success'])
+    logger.info("Batch sync completed: %d/%d successful", successful, len(results))
+
+    return jsonify({
+        'success': successful == len(results),
+        'timestamp': datetime.now().isoformat(),
+        'total_users': len(results),
+        'successful': successful,
+        'failed': len(results) - successful,
+        'results': results
+    }), 200
 
 
 @app.route('/api/status', methods=['GET'])
 @require_api_key
+@json_errors
 def get_status():
     """
     Get sync status for all users.
 
+    The user list is streamed as it is paged from Adalo, so memory stays
+    flat regardless of the number of users. If a later page fails, the
+    body still closes as valid JSON with "success": false and the error.
+
     Headers:
         Authorization: Bearer {api_key}
 
     Returns:
         200 OK with user sync status
     """
-    try:
-        adalo_client = create_client_from_env()
-        users = adalo_client.get_all_users()
-
-        user_status = []
+    def user_status(users):
+        # Only include users with OPG credentials
         for user in users:
-            # Only include users with OPG credentials
-            if user.get('apnumber'):
-                user_status.append({
+            if ap_number := user.get('apnumber'):
+                yield {
                     'user_id': user['id'],
                     'user_name': user.get('first_name'),
                     'user_email': user.get('Email'),
-                    'ap_number': user.get('apnumber'),
+                    'ap_number': ap_number,
                     'last_sync': user.get('lastbizonylatszinkron'),
                     'last_file_number': user.get('lastbizonylatletoltve')
-                })
+                }
 
-        return jsonify({
-            'success': True,
-            'timestamp': datetime.now().isoformat(),
-            'total_users': len(user_status),
-            'users': user_status
-        }), 200
+    adalo_client = get_adalo_client()
+    statuses = user_status(adalo_client.iter_users())
+    # Fetch the first page before responding, so failures still get a 500
+    first = next(statuses, None)
 
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'timestamp': datetime.now().isoformat()
-        }), 500
+    timestamp = datetime.now().isoformat()
+
+    def generate():
+        dumps = app.json.dumps
+        yield '{"timestamp":' + dumps(timestamp) + ',"users":['
+        total = 0
+        error = None
+        try:
+            if first is not None:
+                yield dumps(first)
+                total = 1
+                for status in statuses:
+                    yield ',' + dumps(status)
+                    total += 1
+        except Exception as e:
+            logger.error("Status listing failed after %d users: %s", total, e)
+            error = str(e)
+        tail = {'success': error is None, 'total_users': total}
+        if error is not None:
+            tail['error'] = error
+        yield '],' + dumps(tail)[1:]
+
+    return Response(generate(), mimetype='application/json'), 200
 
 
 @app.route('/api/full-sync/<int:user_id>', methods=['POST'])
 @require_api_key
+@rate_limit(SYNC_USER_RATE_LIMIT)
+@json_errors
 def full_sync(user_id: int):
     """
     Full sync: Sync both OPG and Online Invoice data for a user
@@ -273,99 +711,84 @@ def full_sync(user_id: int):
         404 Not Found if user doesn't exist
         500 Error if sync fails
     """
-    try:
-        logger.info(f"=== FULL SYNC REQUEST FOR USER {user_id} ===")
+    logger.info("=== FULL SYNC REQUEST FOR USER %s ===", user_id)
 
-        # Parse request body
-        data = request.get_json(silent=True) or {}
-        current_year = data.get('current_year', datetime.now().year)
+    # Parse request body
+    data = request.get_json(silent=True) or {}
+    current_year = data.get('current_year', datetime.now().year)
 
-        logger.info(f"Request params: user_id={user_id}, current_year={current_year}")
+    logger.info("Request params: user_id=%s, current_year=%s", user_id, current_year)
 
-        # Create Adalo client
-        logger.info("Creating Adalo client from environment...")
-        adalo_client = create_client_from_env()
-        logger.info("Adalo client created successfully")
-
-        # Get user
-        try:
-            logger.info(f"Fetching user {user_id} from Adalo...")
-            user = adalo_client.get_user_by_id(user_id)
-            logger.info(f"User fetched: {user.get('first_name')} ({user.get('Email')})")
-        except Exception as e:
-            logger.error(f"Failed to fetch user {user_id}: {str(e)}")
-            return jsonify({
-                'success': False,
-                'error': f'User not found: {str(e)}',
-                'timestamp': datetime.now().isoformat()
-            }), 404
+    adalo_client = get_adalo_client()
 
-        results = {
-            'user_id': user_id,
-            'user_name': user.get('first_name'),
-            'user_email': user.get('Email'),
+    # Get user
+    try:
+        logger.info("Fetching user %s from Adalo...", user_id)
+        user = adalo_client.get_user_by_id(user_id)
+        logger.info("User fetched: %s (%s)", user.get('first_name'), user.get('Email'))
+    except Exception as e:
+        logger.error("Failed to fetch user %s: %s", user_id, e)
+        return jsonify({
+            'success': False,
+            'error': f'User not found: {str(e)}',
             'timestamp': datetime.now().isoformat()
-        }
-
-        # 1. Sync OPG (if user has OPG credentials)
-        has_opg = user.get('apnumber') and user.get('navlogin') and user.get('navpassword')
-        if has_opg:
-            logger.info(f"User has OPG credentials, starting OPG sync...")
-            opg_result = sync_user(user, adalo_client, current_year=current_year)
-            results['opg_sync'] = opg_result
-            logger.info(f"OPG sync result: {opg_result}")
-        else:
-            logger.info("User does not have OPG credentials, skipping OPG sync")
-            results['opg_sync'] = {
-                'success': False,
-                'message': 'No OPG credentials',
-                'skipped': True
-            }
-
-        # 2. Sync Online Invoice (if user has Online Invoice credentials)
-        has_online_invoice = all([
-            user.get('navlogin'),
-            user.get('navpassword'),
-            user.get('signKey'),
-            user.get('exchangeKey'),
-            user.get('taxNumber')
-        ])
-
-        if has_online_invoice:
-            logger.info(f"User has Online Invoice credentials, starting Online Invoice sync...")
-            online_invoice_result = sync_online_invoice_for_user(user, adalo_client, year=current_year)
-            results['online_invoice_sync'] = online_invoice_result
-            logger.info(f"Online Invoice sync result: {online_invoice_result}")
-        else:
-            logger.info("User does not have Online Invoice credentials, skipping Online Invoice sync")
-            results['online_invoice_sync'] = {
-                'success': False,
-                'message': 'No Online Invoice credentials',
-                'skipped': True
-            }
+        }), 404
 
-        # Determine overall success
-        opg_success = results['opg_sync'].get('success') or results['opg_sync'].get('skipped')
-        invoice_success = results['online_invoice_sync'].get('success') or results['online_invoice_sync'].get('skipped')
+    results = {
+        'user_id': user_id,
+        'user_name': user.get('first_name'),
+        'user_email': user.get('Email'),
+        'timestamp': datetime.now().isoformat()
+    }
+
+    # 1. Sync OPG (if user has OPG credentials)
+    has_opg = user.get('apnumber') and user.get('navlogin') and user.get('navpassword')
+    if has_opg:
+        logger.info("User has OPG credentials, starting OPG sync...")
+        opg_result = sync_user(user, adalo_client, current_year=current_year)
+        results['opg_sync'] = opg_result
+        logger.info("OPG sync result: %s", opg_result)
+    else:
+        logger.info("User does not have OPG credentials, skipping OPG sync")
+        results['opg_sync'] = {
+            'success': False,
+            'message': 'No OPG credentials',
+            'skipped': True
+        }
 
-        overall_success = opg_success and invoice_success
-        status_code = 200 if overall_success else 500
+    # 2. Sync Online Invoice (if user has Online Invoice credentials)
+    has_online_invoice = all([
+        user.get('navlogin'),
+        user.get('navpassword'),
+        user.get('signKey'),
+        user.get('exchangeKey'),
+        user.get('taxNumber')
+    ])
+
+    if has_online_invoice:
+        logger.info("User has Online Invoice credentials, starting Online Invoice sync...")
+        online_invoice_result = sync_online_invoice_for_user(user, adalo_client, year=current_year)
+        results['online_invoice_sync'] = online_invoice_result
+        logger.info("Online Invoice sync result: %s", online_invoice_result)
+    else:
+        logger.info("User does not have Online Invoice credentials, skipping Online Invoice sync")
+        results['online_invoice_sync'] = {
+            'success': False,
+            'message': 'No Online Invoice credentials',
+            'skipped': True
+        }
 
-        results['success'] = overall_success
+    # Determine overall success
+    opg_success = results['opg_sync'].get('success') or results['opg_sync'].get('skipped')
+    invoice_success = results['online_invoice_sync'].get('success') or results['online_invoice_sync'].get('skipped')
 
-        logger.info(f"Full sync completed with overall success: {overall_success}")
-        return jsonify(results), status_code
+    overall_success = opg_success and invoice_success
+    status_code = 200 if overall_success else 500
 
-    except Exception as e:
-        logger.error(f"=== FULL SYNC ERROR FOR USER {user_id} ===")
-        logger.error(f"Error: {str(e)}")
-        logger.error(f"Traceback:\n{traceback.format_exc()}")
+    results['success'] = overall_success
 
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'timestamp': datetime.now().isoformat()
-        }), 500
+    logger.info("Full sync completed with overall success: %s", overall_success)
+    return jsonify(results), status_code
 
 
 @app.route('/api/online-invoice/query', methods=['GET', 'POST'])
@@ -405,10 +828,7 @@ def online_invoice_query():
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors."""
-    return jsonify({
-        'error': 'Not found',
-        'message': 'The requested endpoint does not exist'
-    }), 404
+    return _json_response(_ERR_NOT_FOUND, 404)
 
 
 @app.errorhandler(500)
@@ -421,6 +841,6 @@ def internal_error(error):
 
 
 if __name__ == '__main__':
-    # Run in development mode
+    # Run the development server (production: gunicorn -c gunicorn_conf.py web_api:app)
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    app.run(host='0.0.0.0', port=port)